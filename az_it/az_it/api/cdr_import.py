@@ -0,0 +1,262 @@
+"""
+Bulk import of call history from 3CX CDR (call data record) CSV exports.
+
+Backfills Communications for calls that 3CX call journaling never delivered.
+The CSV is streamed row by row; numbers are resolved against the normalized
+phone lookup keys in batches and Communications are written with multi-row
+inserts, one commit per chunk. Every record carries the same dedup key that
+log_call derives from number, agent, start time and duration, so calls that
+3CX journaling already logged are skipped and an interrupted import can
+simply be resumed (or rerun). For the keys to match, agent_map has to map
+extensions to the agent emails the 3CX template sends.
+
+The CSV needs a header row with the 3CX CDR field names (see CDR_COLUMNS).
+"""
+
+import csv
+
+import frappe
+from frappe.utils import cint, convert_utc_to_system_timezone, get_datetime, now
+
+from az_it.az_it.api.telephony import _format_call, _make_call, _normalize, _resolve_numbers
+from az_it.az_it.doctype.call_statistics.call_statistics import rebuild_call_statistics
+
+
+CHUNK_SIZE = 500
+
+# Our field -> 3CX CDR column
+CDR_COLUMNS = {
+	"time_start": "time-start",
+	"time_answered": "time-answered",
+	"duration": "duration",
+	"from_no": "from-no",
+	"to_no": "to-no",
+	"from_dn": "from-dn",
+	"to_dn": "to-dn",
+	"final_dn": "final-dn",
+	"from_type": "from-type",
+	"to_type": "to-type",
+}
+
+# 3CX marks external parties (trunks) with this type
+EXTERNAL_TYPE = "Line"
+
+INSERT_FIELDS = [
+	"name",
+	"creation",
+	"modified",
+	"owner",
+	"modified_by",
+	"docstatus",
+	"communication_type",
+	"communication_medium",
+	"sent_or_received",
+	"subject",
+	"content",
+	"phone_no",
+	"reference_doctype",
+	"reference_name",
+	"sender",
+	"communication_date",
+	"status",
+	"custom_call_type",
+	"custom_duration_seconds",
+	"custom_call_id",
+]
+
+
+@frappe.whitelist()
+def import_cdr(file_url, start_row=0, agent_map=None):
+	"""
+	Starts a background import of an uploaded 3CX CDR CSV.
+
+	Args:
+		file_url: URL of the uploaded File
+		start_row: Number of data rows to skip, to resume an interrupted import
+		agent_map: JSON object mapping extension numbers to agent emails
+	"""
+	frappe.only_for("System Manager")
+
+	file_path = frappe.get_doc("File", {"file_url": file_url}).get_full_path()
+	job = frappe.enqueue(
+		"az_it.az_it.api.cdr_import.import_cdr_file",
+		queue="long",
+		timeout=4 * 60 * 60,
+		file_path=file_path,
+		start_row=cint(start_row),
+		agent_map=frappe.parse_json(agent_map) if agent_map else None,
+		progress=_publish_progress,
+	)
+
+	return {"job_id": job.id if job else None}
+
+
+def import_cdr_file(file_path, start_row=0, agent_map=None, progress=None):
+	"""
+	Streams a 3CX CDR CSV into Communications.
+
+	Args:
+		file_path: Path of the CSV file
+		start_row: Number of data rows to skip, to resume an interrupted import
+		agent_map: {extension: agent email}; unmapped extensions are logged as-is
+		progress: Optional callable(summary), called after every committed chunk
+
+	Returns:
+		dict: rows read, calls inserted, duplicates and skipped (internal/empty) rows,
+		plus last_row to pass as start_row when resuming
+	"""
+	agent_map = agent_map or {}
+	start_row = cint(start_row)
+	summary = frappe._dict(
+		rows=0, inserted=0, duplicates=0, skipped=0, last_row=start_row, from_date=None, to_date=None
+	)
+
+	with open(file_path, newline="", encoding="utf-8-sig") as f:
+		chunk = []
+		for row_no, row in enumerate(csv.DictReader(f), start=1):
+			if row_no <= start_row:
+				continue
+
+			summary.rows += 1
+			call = _call_from_cdr_row(row, agent_map)
+			if call:
+				chunk.append(call)
+			else:
+				summary.skipped += 1
+
+			if len(chunk) >= CHUNK_SIZE:
+				_import_chunk(chunk, summary)
+				summary.last_row = start_row + summary.rows
+				chunk = []
+				if progress:
+					progress(summary)
+
+		if chunk:
+			_import_chunk(chunk, summary)
+		summary.last_row = start_row + summary.rows
+
+	if progress:
+		progress(summary)
+
+	return summary
+
+
+def _call_from_cdr_row(row, agent_map):
+	"""Converts one CDR row into a call dict as used by log_call, or None for internal calls."""
+	field = {key: (row.get(column) or "").strip() for key, column in CDR_COLUMNS.items()}
+
+	if field["from_type"] == EXTERNAL_TYPE:
+		number = field["from_no"]
+		extension = field["final_dn"] or field["to_dn"]
+		call_type = "Inbound" if field["time_answered"] else "Missed"
+	elif field["to_type"] == EXTERNAL_TYPE:
+		number = field["to_no"]
+		extension = field["from_dn"]
+		call_type = "Outbound" if field["time_answered"] else "Notanswered"
+	else:
+		return None
+
+	if not number or not field["time_start"]:
+		return None
+
+	# The 3CX template reports unanswered calls with a duration of 0
+	duration = _parse_duration(field["duration"]) if field["time_answered"] else 0
+
+	# time-start is UTC, like the call_start the 3CX template sends, so the
+	# derived dedup key matches the one of a journaled call
+	call = _make_call(
+		"", "Contact", call_type, "", duration, agent_map.get(extension, extension), number,
+		call_start=field["time_start"],
+	)
+	call["communication_date"] = str(
+		convert_utc_to_system_timezone(get_datetime(field["time_start"])).replace(tzinfo=None)
+	)
+
+	return call
+
+
+def _parse_duration(value):
+	"""CDR durations are either HH:MM:SS(.fff) or plain seconds."""
+	if ":" not in value:
+		return cint(float(value or 0))
+
+	seconds = 0
+	for part in value.split(":"):
+		seconds = seconds * 60 + float(part or 0)
+	return int(seconds)
+
+
+def _import_chunk(calls, summary):
+	"""
+	Resolves the chunk's numbers, drops already imported calls and inserts the
+	rest in one statement. The chunk's days are re-aggregated into Call
+	Statistics in the same commit, so an interrupted import leaves no
+	committed calls outside the rollup.
+	"""
+	existing = set(
+		frappe.get_all(
+			"Communication",
+			filters={"custom_call_id": ["in", [call["call_id"] for call in calls]]},
+			pluck="custom_call_id",
+		)
+	)
+	new_calls = {call["call_id"]: call for call in calls if call["call_id"] not in existing}
+	summary.duplicates += len(calls) - len(new_calls)
+
+	if new_calls:
+		keys = {_normalize(call["number"]) for call in new_calls.values()}
+		entities = _resolve_numbers({key for key in keys if key})
+
+		timestamp = now()
+		values = []
+		from_date = to_date = None
+		for call in new_calls.values():
+			entity = entities.get(_normalize(call["number"]))
+			if entity:
+				call["entity_id"] = entity["contact_id"]
+				call["entity_type"] = entity["entity_type"]
+
+			call_date = call["communication_date"][:10]
+			from_date = min(from_date or call_date, call_date)
+			to_date = max(to_date or call_date, call_date)
+
+			sent_or_received, subject, content = _format_call(call)
+			values.append(
+				(
+					frappe.generate_hash(length=10),
+					timestamp,
+					timestamp,
+					frappe.session.user,
+					frappe.session.user,
+					0,
+					"Communication",
+					"Phone",
+					sent_or_received,
+					subject,
+					content,
+					call["number"],
+					call["entity_type"] if call["entity_id"] else None,
+					call["entity_id"] or None,
+					call["agent_email"],
+					call["communication_date"],
+					"Linked",
+					call["call_type"],
+					call["duration_seconds"],
+					call["call_id"],
+				)
+			)
+
+		# IGNORE keeps reruns and overlapping resumes safe via the unique custom_call_id
+		frappe.db.bulk_insert("Communication", INSERT_FIELDS, values, ignore_duplicates=True)
+		summary.inserted += len(values)
+
+		# Bulk inserts bypass log_call, so the chunk's days are re-aggregated
+		rebuild_call_statistics(from_date, to_date)
+		summary.from_date = min(summary.from_date or from_date, from_date)
+		summary.to_date = max(summary.to_date or to_date, to_date)
+
+	frappe.db.commit()
+
+
+def _publish_progress(summary):
+	frappe.publish_realtime("az_it_cdr_import_progress", dict(summary), user=frappe.session.user)
@@ -1,6 +1,32 @@
+import hashlib
+import json
 import re
+import time
+from collections import OrderedDict
+from datetime import timezone
+
 import frappe
-from frappe.utils import now_datetime
+from frappe import _
+from frappe.utils import cint, get_datetime, now_datetime
+
+from az_it.az_it.doctype.call_statistics.call_statistics import add_call as add_call_to_statistics
+
+
+CACHE_KEY_PREFIX = "az_it:telephony:lookup:"
+CACHE_TTL = 24 * 60 * 60  # matched numbers (Redis)
+NEGATIVE_CACHE_TTL = 5 * 60  # unknown numbers, e.g. spam calls (Redis)
+LOCAL_CACHE_SIZE = 1024
+LOCAL_CACHE_TTL = 30  # per-worker tier; bounds staleness in other workers after an edit
+LOOKUP_BATCH_SIZE = 500  # normalized numbers per IN (...) query
+
+CALL_TYPES = ("Inbound", "Outbound", "Missed", "Notanswered")
+CALL_QUEUE_KEY = "az_it:telephony:call_queue"
+CALL_QUEUE_STATS_KEY = "az_it:telephony:call_queue_stats"
+CALL_QUEUE_JOB_ID = "az_it_drain_call_queue"
+CALL_QUEUE_BATCH_SIZE = 100
+
+# (site, normalized number) -> (expires_at, lookup result)
+_local_cache = OrderedDict()
 
 
 def _normalize(number):
@@ -9,87 +35,235 @@ def _normalize(number):
 	return digits[-9:] if len(digits) >= 9 else digits
 
 
+# Lead phone field -> indexed custom field holding its normalized lookup key
+LEAD_PHONE_KEY_FIELDS = {
+	"phone": "custom_phone_key",
+	"mobile_no": "custom_mobile_no_key",
+	"whatsapp_no": "custom_whatsapp_no_key",
+}
+
+
+def set_contact_phone_keys(doc, method=None):
+	"""
+	Hook: Contact.validate
+
+	Stores the normalized number of every Contact Phone row in the indexed
+	custom_phone_key column so caller lookups become a point lookup.
+	"""
+	for row in doc.get("phone_nos") or []:
+		row.custom_phone_key = _normalize(row.phone or "")
+
+
+def set_lead_phone_keys(doc, method=None):
+	"""
+	Hook: Lead.validate
+
+	Stores the normalized phone, mobile and WhatsApp numbers in their indexed
+	lookup key columns.
+	"""
+	for fieldname, key_fieldname in LEAD_PHONE_KEY_FIELDS.items():
+		doc.set(key_fieldname, _normalize(doc.get(fieldname) or ""))
+
+
+def invalidate_contact_lookup_cache(doc, method=None):
+	"""
+	Hook: Contact.on_update / Contact.on_trash
+
+	Drops cached lookups for the contact's current and previous numbers.
+	"""
+	rows = list(doc.get("phone_nos") or [])
+	before = doc.get_doc_before_save()
+	if before:
+		rows.extend(before.get("phone_nos") or [])
+
+	_invalidate_cached_lookups({_normalize(row.phone or "") for row in rows})
+
+
+def invalidate_lead_lookup_cache(doc, method=None):
+	"""
+	Hook: Lead.on_update / Lead.on_trash
+
+	Drops cached lookups for the lead's current and previous numbers.
+	"""
+	docs = [doc, doc.get_doc_before_save()]
+	_invalidate_cached_lookups(
+		{_normalize(d.get(fieldname) or "") for d in docs if d for fieldname in LEAD_PHONE_KEY_FIELDS}
+	)
+
+
+def _get_cached_lookup(normalized):
+	"""Returns the cached lookup result ({} for unknown numbers) or None on a miss."""
+	local_key = (frappe.local.site, normalized)
+	entry = _local_cache.get(local_key)
+	if entry:
+		expires_at, result = entry
+		if expires_at > time.monotonic():
+			_local_cache.move_to_end(local_key)
+			return result
+		_local_cache.pop(local_key, None)
+
+	result = frappe.cache().get_value(CACHE_KEY_PREFIX + normalized)
+	if result is not None:
+		_set_local_lookup(local_key, result)
+	return result
+
+
+def _set_cached_lookup(normalized, result):
+	frappe.cache().set_value(
+		CACHE_KEY_PREFIX + normalized,
+		result,
+		expires_in_sec=CACHE_TTL if result else NEGATIVE_CACHE_TTL,
+	)
+	_set_local_lookup((frappe.local.site, normalized), result)
+
+
+def _set_local_lookup(local_key, result):
+	_local_cache[local_key] = (time.monotonic() + LOCAL_CACHE_TTL, result)
+	_local_cache.move_to_end(local_key)
+	while len(_local_cache) > LOCAL_CACHE_SIZE:
+		_local_cache.popitem(last=False)
+
+
+def _invalidate_cached_lookups(keys):
+	"""Removes lookup results for the given normalized numbers once the transaction commits."""
+	keys = {key for key in keys if key}
+	if not keys:
+		return
+
+	def invalidate():
+		for key in keys:
+			_local_cache.pop((frappe.local.site, key), None)
+		frappe.cache().delete_value([CACHE_KEY_PREFIX + key for key in keys])
+
+	# Invalidating before commit would let a concurrent lookup re-cache stale rows
+	frappe.db.after_commit.add(invalidate)
+
+
 def _lookup_contact(normalized):
 	"""Search Contact Phone child table by normalized number."""
-	result = frappe.db.sql(
+	return _lookup_contacts([normalized]).get(normalized)
+
+
+def _lookup_contacts(keys):
+	"""
+	Search Contact Phone child table for a set of normalized numbers.
+
+	Returns {normalized: contact info}. The matched contacts, their primary
+	(or first) email and all of their phones come back from a single query:
+	one row per phone, ordered like the 3CX fields.
+	"""
+	rows = frappe.db.sql(
 		"""
 		SELECT
-			cp.parent AS contact_id,
+			matched.phone_key,
+			c.name AS contact_id,
 			c.first_name,
 			c.last_name,
 			c.company_name,
-			cp.phone AS matched_phone
-		FROM `tabContact Phone` cp
-		JOIN `tabContact` c ON c.name = cp.parent
-		WHERE RIGHT(REGEXP_REPLACE(cp.phone, '[^0-9]', ''), 9) = %s
-		LIMIT 1
+			(
+				SELECT ce.email_id
+				FROM `tabContact Email` ce
+				WHERE ce.parent = c.name
+				ORDER BY ce.is_primary DESC, ce.idx
+				LIMIT 1
+			) AS email,
+			p.phone
+		FROM (
+			SELECT custom_phone_key AS phone_key, MIN(parent) AS parent
+			FROM `tabContact Phone`
+			WHERE custom_phone_key IN %(keys)s
+			GROUP BY custom_phone_key
+		) matched
+		JOIN `tabContact` c ON c.name = matched.parent
+		JOIN `tabContact Phone` p ON p.parent = c.name AND p.parenttype = 'Contact'
+		ORDER BY matched.phone_key, p.is_primary_mobile_no DESC, p.idx
 		""",
-		(normalized,),
+		{"keys": tuple(keys)},
 		as_dict=True,
 	)
-	if not result:
-		return None
 
-	row = result[0]
-	contact_id = row["contact_id"]
+	rows_by_key = {}
+	for row in rows:
+		rows_by_key.setdefault(row["phone_key"], []).append(row)
 
-	# Get email
-	email_row = frappe.db.get_value(
-		"Contact Email", {"parent": contact_id, "is_primary": 1}, "email_id"
-	) or frappe.db.get_value("Contact Email", {"parent": contact_id}, "email_id")
+	result = {}
+	for key, contact_rows in rows_by_key.items():
+		row = contact_rows[0]
+		phone_business = row["phone"]
+		phone_mobile = contact_rows[1]["phone"] if len(contact_rows) > 1 else ""
 
-	# Get all phones for the contact
-	phones = frappe.db.get_all(
-		"Contact Phone",
-		filters={"parent": contact_id},
-		fields=["phone", "is_primary_mobile_no"],
-		order_by="is_primary_mobile_no desc",
-	)
+		full_name = " ".join(filter(None, [row.get("first_name"), row.get("last_name")]))
 
-	phone_business = phones[0]["phone"] if phones else ""
-	phone_mobile = phones[1]["phone"] if len(phones) > 1 else ""
+		result[key] = {
+			"contact_id": row["contact_id"],
+			"first_name": full_name or row.get("company_name") or "",
+			"company_name": row.get("company_name") or "",
+			"email": row.get("email") or "",
+			"phone_business": phone_business or "",
+			"phone_mobile": phone_mobile or "",
+			"entity_type": "Contact",
+		}
 
-	full_name = " ".join(filter(None, [row.get("first_name"), row.get("last_name")]))
-
-	return {
-		"contact_id": contact_id,
-		"first_name": full_name or row.get("company_name") or "",
-		"company_name": row.get("company_name") or "",
-		"email": email_row or "",
-		"phone_business": phone_business or "",
-		"phone_mobile": phone_mobile or "",
-		"entity_type": "Contact",
-	}
+	return result
 
 
 def _lookup_lead(normalized):
 	"""Search Lead by phone/mobile/whatsapp fields."""
-	result = frappe.db.sql(
+	return _lookup_leads([normalized]).get(normalized)
+
+
+def _lookup_leads(keys):
+	"""Search Lead phone/mobile/whatsapp lookup keys for a set of normalized numbers."""
+	rows = frappe.db.sql(
 		"""
-		SELECT name, lead_name, company_name, email_id, phone, mobile_no
+		SELECT
+			name, lead_name, company_name, email_id, phone, mobile_no,
+			custom_phone_key, custom_mobile_no_key, custom_whatsapp_no_key
 		FROM `tabLead`
 		WHERE
-			RIGHT(REGEXP_REPLACE(IFNULL(phone, ''), '[^0-9]', ''), 9) = %s
-			OR RIGHT(REGEXP_REPLACE(IFNULL(mobile_no, ''), '[^0-9]', ''), 9) = %s
-			OR RIGHT(REGEXP_REPLACE(IFNULL(whatsapp_no, ''), '[^0-9]', ''), 9) = %s
-		LIMIT 1
+			custom_phone_key IN %(keys)s
+			OR custom_mobile_no_key IN %(keys)s
+			OR custom_whatsapp_no_key IN %(keys)s
+		ORDER BY name
 		""",
-		(normalized, normalized, normalized),
+		{"keys": tuple(keys)},
 		as_dict=True,
 	)
-	if not result:
-		return None
 
-	row = result[0]
-	return {
-		"contact_id": row["name"],
-		"first_name": row.get("lead_name") or "",
-		"company_name": row.get("company_name") or "",
-		"email": row.get("email_id") or "",
-		"phone_business": row.get("phone") or "",
-		"phone_mobile": row.get("mobile_no") or "",
-		"entity_type": "Lead",
-	}
+	result = {}
+	for row in rows:
+		entity = {
+			"contact_id": row["name"],
+			"first_name": row.get("lead_name") or "",
+			"company_name": row.get("company_name") or "",
+			"email": row.get("email_id") or "",
+			"phone_business": row.get("phone") or "",
+			"phone_mobile": row.get("mobile_no") or "",
+			"entity_type": "Lead",
+		}
+		for key_fieldname in LEAD_PHONE_KEY_FIELDS.values():
+			if row.get(key_fieldname) in keys:
+				result.setdefault(row[key_fieldname], entity)
+
+	return result
+
+
+def _resolve_numbers(keys):
+	"""
+	Resolves a set of normalized numbers with set-based queries.
+	Contacts take precedence over Leads, as in lookup_contact_by_number.
+	"""
+	result = {}
+	keys = sorted(keys)
+	for i in range(0, len(keys), LOOKUP_BATCH_SIZE):
+		chunk = set(keys[i : i + LOOKUP_BATCH_SIZE])
+		found = _lookup_contacts(chunk)
+		missing = chunk - set(found)
+		if missing:
+			found.update(_lookup_leads(missing))
+		result.update(found)
+
+	return result
 
 
 @frappe.whitelist()
@@ -97,6 +271,9 @@ def lookup_contact_by_number(number):
 	"""
 	Called by 3CX when a call comes in.
 	Returns contact info for the given phone number, or {} if not found.
+
+	Results (including misses) are cached per worker and in Redis, keyed by
+	the normalized number; Contact/Lead hooks invalidate them on change.
 	"""
 	if not number:
 		return {}
@@ -105,8 +282,34 @@ def lookup_contact_by_number(number):
 	if not normalized:
 		return {}
 
-	result = _lookup_contact(normalized) or _lookup_lead(normalized)
-	return result or {}
+	result = _get_cached_lookup(normalized)
+	if result is None:
+		result = _lookup_contact(normalized) or _lookup_lead(normalized) or {}
+		_set_cached_lookup(normalized, result)
+
+	return result
+
+
+@frappe.whitelist()
+def lookup_contacts_by_numbers(numbers):
+	"""
+	Batch variant of lookup_contact_by_number for 3CX contact sync and
+	call-history enrichment.
+
+	Accepts a list (or JSON list) of numbers and returns a map of each given
+	number to its contact info, or {} if not found. All numbers are resolved
+	with set-based queries against the normalized lookup keys.
+	"""
+	if isinstance(numbers, str):
+		numbers = frappe.parse_json(numbers)
+
+	if not isinstance(numbers, (list, tuple)):
+		frappe.throw(_("numbers must be a list of phone numbers"))
+
+	normalized_by_number = {str(number): _normalize(str(number)) for number in numbers if number}
+	found = _resolve_numbers({key for key in normalized_by_number.values() if key})
+
+	return {number: found.get(key, {}) for number, key in normalized_by_number.items()}
 
 
 @frappe.whitelist()
@@ -118,29 +321,145 @@ def log_call(
 	duration_seconds=0,
 	agent_email="",
 	number="",
+	fast_ack=None,
+	call_id="",
+	call_start="",
 ):
 	"""
 	Called by 3CX after a call ends.
 	Creates a Communication record linked to the Contact or Lead.
+
+	Idempotent: the call is keyed by call_id, or by a hash of number, agent,
+	call_start and duration when only call_start is given (the 3CX template
+	sends the call's UTC start time). Retries of an already logged call
+	return the existing Communication.
+
+	In fast-ack mode (fast_ack=1, or site config az_it_call_log_fast_ack) the
+	call is only validated and queued in Redis; drain_call_queue inserts it
+	from a background job.
 	"""
-	sent_or_received = "Received" if call_type in ("Inbound", "Missed") else "Sent"
+	call = _make_call(
+		entity_id, entity_type, call_type, call_direction, duration_seconds, agent_email, number,
+		call_id, call_start,
+	)
+
+	if fast_ack is None:
+		fast_ack = frappe.conf.get("az_it_call_log_fast_ack")
+
+	if cint(fast_ack):
+		existing = _get_logged_call(call)
+		if existing:
+			return {"communication": existing}
+
+		_enqueue_call(call)
+		return {"queued": 1}
+
+	name = _insert_call(call)
+	frappe.db.commit()
+
+	return {"communication": name}
+
+
+def _make_call(
+	entity_id, entity_type, call_type, call_direction, duration_seconds, agent_email, number,
+	call_id="", call_start="",
+):
+	"""Validates the 3CX parameters and returns the call as a plain, JSON-serializable dict."""
+	if call_type not in CALL_TYPES:
+		frappe.throw(_("Unknown call type: {0}").format(call_type))
+
+	if entity_id and entity_type not in ("Contact", "Lead"):
+		frappe.throw(_("Unknown entity type: {0}").format(entity_type))
 
 	try:
 		duration_seconds = int(float(duration_seconds))
 	except (ValueError, TypeError):
 		duration_seconds = 0
 
-	minutes, seconds = divmod(duration_seconds, 60)
+	if not call_id and call_start:
+		call_id = _derive_call_id(number, agent_email, call_start, duration_seconds)
+
+	return {
+		"entity_id": entity_id or "",
+		"entity_type": entity_type,
+		"call_type": call_type,
+		"call_direction": call_direction or "",
+		"duration_seconds": duration_seconds,
+		"agent_email": agent_email or "",
+		"number": number or "",
+		"communication_date": str(now_datetime()),
+		"call_id": str(call_id or "").strip()[:140],
+	}
+
+
+def _derive_call_id(number, agent_email, call_start, duration_seconds):
+	"""
+	Stable dedup key for calls that don't carry a call id: PBX retries of
+	log_call and CDR imports (cdr_import) of the same call get the same key.
+	"""
+	raw = "|".join(
+		[
+			_normalize(str(number or "")),
+			str(agent_email or "").lower(),
+			_normalize_call_start(call_start),
+			str(cint(duration_seconds)),
+		]
+	)
+	return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _normalize_call_start(call_start):
+	# The 3CX template and CDR exports format the (UTC) start time differently
+	try:
+		start = get_datetime(call_start)
+	except (ValueError, TypeError, OverflowError):
+		return str(call_start)
+
+	if start.tzinfo:
+		start = start.astimezone(timezone.utc).replace(tzinfo=None)
+	return str(start.replace(microsecond=0))
+
+
+def _get_logged_call(call):
+	"""Returns the Communication already logged for the call's dedup key, if any."""
+	if not call.get("call_id"):
+		return None
+
+	return frappe.db.get_value("Communication", {"custom_call_id": call["call_id"]})
+
+
+def _format_call(call):
+	"""Returns (sent_or_received, subject, content) of the Communication for a call."""
+	call_type = call["call_type"]
+	number = call["number"]
+	sent_or_received = "Received" if call_type in ("Inbound", "Missed") else "Sent"
+
+	minutes, seconds = divmod(call["duration_seconds"], 60)
 	duration_str = f"{minutes}m {seconds}s" if minutes else f"{seconds}s"
 
 	subject = f"{call_type} call {'from' if sent_or_received == 'Received' else 'to'} {number}"
 	content_lines = [
 		f"Duration: {duration_str}",
-		f"Agent: {agent_email}",
+		f"Agent: {call['agent_email']}",
 		f"Number: {number}",
 	]
-	if call_direction:
-		content_lines.append(f"Direction: {call_direction}")
+	if call["call_direction"]:
+		content_lines.append(f"Direction: {call['call_direction']}")
+
+	return sent_or_received, subject, "\n".join(content_lines)
+
+
+def _insert_call(call):
+	"""
+	Creates the Communication for a call and returns its name (no commit).
+	Already logged calls are not inserted again; their existing name is returned.
+	"""
+	existing = _get_logged_call(call)
+	if existing:
+		return existing
+
+	sent_or_received, subject, content = _format_call(call)
+	entity_id = call["entity_id"]
 
 	doc = frappe.get_doc(
 		{
@@ -149,18 +468,109 @@ def log_call(
 			"communication_medium": "Phone",
 			"sent_or_received": sent_or_received,
 			"subject": subject,
-			"content": "\n".join(content_lines),
-			"phone_no": number,
-			"reference_doctype": entity_type if entity_id else None,
+			"content": content,
+			"phone_no": call["number"],
+			"reference_doctype": call["entity_type"] if entity_id else None,
 			"reference_name": entity_id if entity_id else None,
-			"sender": agent_email,
-			"communication_date": now_datetime(),
+			"sender": call["agent_email"],
+			"communication_date": call["communication_date"],
 			"status": "Linked",
-			"custom_call_type": call_type,
-			"custom_duration_seconds": duration_seconds,
+			"custom_call_type": call["call_type"],
+			"custom_duration_seconds": call["duration_seconds"],
+			"custom_call_id": call.get("call_id") or None,
 		}
 	)
-	doc.insert(ignore_permissions=True)
-	frappe.db.commit()
 
-	return {"communication": doc.name}
+	try:
+		frappe.db.savepoint("az_it_call_id")
+		doc.insert(ignore_permissions=True)
+	except frappe.UniqueValidationError:
+		if not call.get("call_id"):
+			raise
+		# A concurrent retry of the same call was inserted first
+		frappe.db.rollback(save_point="az_it_call_id")
+		return _get_logged_call(call)
+
+	add_call_to_statistics(
+		call["communication_date"], call["agent_email"], call["call_type"], call["duration_seconds"]
+	)
+
+	return doc.name
+
+
+def _enqueue_call(call):
+	"""Pushes a validated call onto the Redis call queue and makes sure a drain job is queued."""
+	frappe.cache().rpush(CALL_QUEUE_KEY, json.dumps({"call": call, "queued_at": time.time()}))
+	_enqueue_call_queue_drain()
+
+
+def _enqueue_call_queue_drain():
+	# A fixed job id keeps a single drainer per site; repeated enqueues are no-ops
+	frappe.enqueue(
+		"az_it.az_it.api.telephony.drain_call_queue",
+		queue="short",
+		job_id=CALL_QUEUE_JOB_ID,
+		deduplicate=True,
+	)
+
+
+def schedule_call_queue_drain():
+	"""
+	Scheduled (all): backstop for calls queued while a drain job was already
+	finishing, so nothing stays in the queue until the next call comes in.
+	"""
+	if frappe.cache().llen(CALL_QUEUE_KEY):
+		_enqueue_call_queue_drain()
+
+
+def drain_call_queue():
+	"""
+	Background job: inserts queued calls in batches with one commit per batch.
+
+	Entries are removed from the queue only after their batch is committed, so
+	a crashed worker re-delivers the batch instead of losing it.
+	"""
+	cache = frappe.cache()
+
+	while True:
+		entries = [json.loads(entry) for entry in cache.lrange(CALL_QUEUE_KEY, 0, CALL_QUEUE_BATCH_SIZE - 1)]
+		if not entries:
+			break
+
+		for entry in entries:
+			try:
+				frappe.db.savepoint("az_it_log_call")
+				_insert_call(entry["call"])
+			except Exception:
+				frappe.db.rollback(save_point="az_it_log_call")
+				frappe.log_error(
+					frappe.get_traceback(),
+					f"Telephony: Error logging queued call from {entry['call'].get('number')}",
+				)
+
+		frappe.db.commit()
+		cache.ltrim(CALL_QUEUE_KEY, len(entries), -1)
+
+		cache.set_value(
+			CALL_QUEUE_STATS_KEY,
+			{
+				"last_drained_at": str(now_datetime()),
+				"last_batch_size": len(entries),
+				"last_batch_lag_seconds": round(time.time() - entries[0]["queued_at"], 3),
+			},
+		)
+
+
+@frappe.whitelist()
+def get_call_queue_status():
+	"""Returns depth and lag of the fast-ack call queue and stats of the last drained batch."""
+	frappe.only_for("System Manager")
+
+	cache = frappe.cache()
+	oldest = cache.lrange(CALL_QUEUE_KEY, 0, 0)
+
+	return {
+		"depth": cache.llen(CALL_QUEUE_KEY),
+		"lag_seconds": round(time.time() - json.loads(oldest[0])["queued_at"], 3) if oldest else 0,
+		**(cache.get_value(CALL_QUEUE_STATS_KEY) or {}),
+	}
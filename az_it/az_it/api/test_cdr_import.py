@@ -0,0 +1,44 @@
+# Copyright (c) 2026, ahmad mohammad and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from az_it.az_it.api import cdr_import, telephony
+
+
+class TestCdrImport(FrappeTestCase):
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def test_journaled_call_is_a_duplicate(self):
+		# As logged by the 3CX template; _insert_call is log_call without its commit
+		telephony._insert_call(
+			telephony._make_call(
+				"", "Contact", "Inbound", "", 42, "agent@example.com", "030 12345678",
+				call_start="2026-10-18T09:00:00Z",
+			)
+		)
+
+		call = cdr_import._call_from_cdr_row(
+			{
+				"time-start": "2026-10-18 09:00:00",
+				"time-answered": "2026-10-18 09:00:05",
+				"duration": "00:00:42",
+				"from-no": "+49 30 1234 5678",
+				"from-type": "Line",
+				"to-dn": "101",
+				"to-type": "Extension",
+			},
+			{"101": "agent@example.com"},
+		)
+		summary = frappe._dict(inserted=0, duplicates=0, from_date=None, to_date=None)
+
+		# _import_chunk commits per chunk; tearDown has to be able to roll back
+		with patch.object(frappe.db, "commit"):
+			cdr_import._import_chunk([call], summary)
+
+		self.assertEqual(summary.duplicates, 1)
+		self.assertEqual(summary.inserted, 0)
@@ -0,0 +1,102 @@
+# Copyright (c) 2026, ahmad mohammad and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from az_it.az_it.api import telephony
+
+
+class TestTelephonyLookup(FrappeTestCase):
+	def setUp(self):
+		# A non-primary email listed first must not win over the primary one
+		self.contact = _make_contact(
+			"Anrufer",
+			"+49 30 1234 5678",
+			"0171 2345678",
+			email_ids=[
+				{"email_id": "zentrale@example.com"},
+				{"email_id": "anrufer@example.com", "is_primary": 1},
+			],
+		)
+
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def test_contact_lookup_hydrates_in_one_query(self):
+		with self.assertQueryCount(1):
+			result = telephony._lookup_contact(telephony._normalize("030 12345678"))
+
+		self.assertEqual(result["contact_id"], self.contact.name)
+		self.assertEqual(result["email"], "anrufer@example.com")
+		self.assertEqual(result["phone_business"], "0171 2345678")
+		self.assertEqual(result["phone_mobile"], "+49 30 1234 5678")
+
+	def test_query_count_does_not_grow_with_contacts(self):
+		"""Micro-benchmark: a lookup stays a single query however many contacts exist."""
+		for i in range(50):
+			_make_contact(f"Anrufer {i}", f"+49 40 5550 {i:04d}", f"0160 555{i:04d}")
+
+		for number in ("040 55500007", "0160 5550042", "030 12345678"):
+			with self.assertQueryCount(1):
+				self.assertTrue(telephony._lookup_contact(telephony._normalize(number)))
+
+	def test_batch_lookup_is_set_based(self):
+		for i in range(20):
+			_make_contact(f"Anrufer {i}", f"+49 40 5550 {i:04d}", f"0160 555{i:04d}")
+
+		numbers = [f"040 5550{i:04d}" for i in range(20)] + ["030 12345678", "0800 0000000"]
+		# One contact query for all numbers plus one lead query for the misses
+		with self.assertQueryCount(2):
+			result = telephony.lookup_contacts_by_numbers(numbers)
+
+		self.assertEqual(set(result), set(numbers))
+		self.assertEqual(result["030 12345678"]["contact_id"], self.contact.name)
+		self.assertEqual(result["0800 0000000"], {})
+		self.assertTrue(all(result[n]["entity_type"] == "Contact" for n in numbers[:20]))
+
+	def test_unknown_number(self):
+		with self.assertQueryCount(1):
+			self.assertIsNone(telephony._lookup_contact("999999999"))
+
+
+class TestLogCall(FrappeTestCase):
+	# _insert_call is what log_call commits; called directly, tearDown can roll it back
+
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def test_retried_call_is_logged_once(self):
+		first = telephony._insert_call(_make_call(call_id="3cx-4711"))
+		retry = telephony._insert_call(_make_call(call_id="3cx-4711"))
+
+		self.assertEqual(first, retry)
+		self.assertEqual(frappe.db.count("Communication", {"custom_call_id": "3cx-4711"}), 1)
+
+	def test_call_id_is_derived_from_call_start(self):
+		first = telephony._insert_call(_make_call(call_start="2026-10-18 09:00:00"))
+		retry = telephony._insert_call(_make_call(call_start="2026-10-18 09:00:00"))
+		other = telephony._insert_call(_make_call(call_start="2026-10-18 09:05:00"))
+
+		self.assertEqual(first, retry)
+		self.assertNotEqual(first, other)
+
+
+def _make_call(call_id="", call_start=""):
+	return telephony._make_call(
+		"", "Contact", "Inbound", "", 42, "agent@example.com", "+49 30 1234 5678", call_id, call_start
+	)
+
+
+def _make_contact(first_name, phone, mobile_no, email_ids=None):
+	return frappe.get_doc(
+		{
+			"doctype": "Contact",
+			"first_name": first_name,
+			"email_ids": email_ids or [],
+			"phone_nos": [
+				{"phone": phone, "is_primary_phone": 1},
+				{"phone": mobile_no, "is_primary_mobile_no": 1},
+			],
+		}
+	).insert(ignore_permissions=True)
@@ -39,6 +39,15 @@ def run_diagnostics():
 	)
 	results["recent_errors"] = errors
 
+	# 6. Recent automation runs?
+	runs = frappe.db.sql(
+		"""SELECT name, status, started, wall_time_seconds, total_queries, invoices_scanned, dunnings_planned,
+			level_1_drafts, level_2_drafts, level_3_drafts, errors
+		FROM `tabDunning Automation Run` ORDER BY started DESC LIMIT 5""",
+		as_dict=True,
+	)
+	results["recent_runs"] = runs
+
 	for key, val in results.items():
 		print(f"\n--- {key} ---")
 		print(val)
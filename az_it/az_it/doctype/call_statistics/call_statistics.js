@@ -0,0 +1,8 @@
+// Copyright (c) 2026, ahmad mohammad and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("Call Statistics", {
+// 	refresh(frm) {
+
+// 	},
+// });
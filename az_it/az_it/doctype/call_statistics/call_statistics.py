@@ -0,0 +1,107 @@
+# Copyright (c) 2026, ahmad mohammad and contributors
+# For license information, please see license.txt
+
+import hashlib
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import add_days, getdate, now, today
+
+
+# Days re-aggregated from tabCommunication by the nightly reconciliation
+RECONCILE_DAYS = 7
+
+
+class CallStatistics(Document):
+	pass
+
+
+def add_call(call_date, agent, call_type, duration_seconds):
+	"""
+	Adds one logged call to its (day, agent, call type) row.
+
+	Rows are named by a hash of their key, so the upsert needs no lookup and
+	concurrent calls for the same row are serialized by the primary key.
+	"""
+	call_date = str(getdate(call_date))
+	agent = agent or ""
+	call_type = call_type or ""
+	timestamp = now()
+
+	frappe.db.sql(
+		"""
+		INSERT INTO `tabCall Statistics`
+			(name, creation, modified, owner, modified_by, docstatus, idx,
+			call_date, agent, call_type, call_count, total_duration_seconds, max_duration_seconds)
+		VALUES
+			(%(name)s, %(timestamp)s, %(timestamp)s, %(user)s, %(user)s, 0, 0,
+			%(call_date)s, %(agent)s, %(call_type)s, 1, %(duration)s, %(duration)s)
+		ON DUPLICATE KEY UPDATE
+			call_count = call_count + 1,
+			total_duration_seconds = total_duration_seconds + VALUES(total_duration_seconds),
+			max_duration_seconds = GREATEST(max_duration_seconds, VALUES(max_duration_seconds)),
+			modified = VALUES(modified)
+		""",
+		{
+			"name": _get_row_name(call_date, agent, call_type),
+			"timestamp": timestamp,
+			"user": frappe.session.user,
+			"call_date": call_date,
+			"agent": agent,
+			"call_type": call_type,
+			"duration": int(duration_seconds or 0),
+		},
+	)
+
+
+def reconcile_call_statistics():
+	"""
+	Scheduled (daily): rebuilds the last RECONCILE_DAYS days from tabCommunication,
+	picking up deleted calls and anything the incremental path missed.
+	"""
+	rebuild_call_statistics(add_days(today(), -RECONCILE_DAYS), today())
+	frappe.db.commit()
+
+
+def rebuild_call_statistics(from_date=None, to_date=None):
+	"""Re-aggregates the given date range (or all history) from tabCommunication (no commit)."""
+	conditions = ["c.communication_medium = 'Phone'"]
+	delete_conditions = ["1 = 1"]
+	values = {"timestamp": now(), "user": frappe.session.user}
+
+	if from_date:
+		conditions.append("c.communication_date >= %(from_date)s")
+		delete_conditions.append("call_date >= %(from_date)s")
+		values["from_date"] = str(getdate(from_date))
+
+	if to_date:
+		conditions.append("c.communication_date < %(to_date)s")
+		delete_conditions.append("call_date < %(to_date)s")
+		values["to_date"] = str(add_days(getdate(to_date), 1))
+
+	frappe.db.sql(f"DELETE FROM `tabCall Statistics` WHERE {' AND '.join(delete_conditions)}", values)
+	frappe.db.sql(
+		f"""
+		INSERT INTO `tabCall Statistics`
+			(name, creation, modified, owner, modified_by, docstatus, idx,
+			call_date, agent, call_type, call_count, total_duration_seconds, max_duration_seconds)
+		SELECT
+			MD5(CONCAT_WS('|', DATE(c.communication_date), IFNULL(c.sender, ''), IFNULL(c.custom_call_type, ''))),
+			%(timestamp)s, %(timestamp)s, %(user)s, %(user)s, 0, 0,
+			DATE(c.communication_date),
+			IFNULL(c.sender, ''),
+			IFNULL(c.custom_call_type, ''),
+			COUNT(*),
+			SUM(IFNULL(c.custom_duration_seconds, 0)),
+			MAX(IFNULL(c.custom_duration_seconds, 0))
+		FROM `tabCommunication` c
+		WHERE {' AND '.join(conditions)}
+		GROUP BY DATE(c.communication_date), IFNULL(c.sender, ''), IFNULL(c.custom_call_type, '')
+		""",
+		values,
+	)
+
+
+def _get_row_name(call_date, agent, call_type):
+	# Must match the MD5(CONCAT_WS(...)) in rebuild_call_statistics
+	return hashlib.md5(f"{call_date}|{agent}|{call_type}".encode()).hexdigest()
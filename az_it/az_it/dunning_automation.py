@@ -1,5 +1,40 @@
+import time
+from contextlib import contextmanager
+
 import frappe
-from frappe.utils import today, add_days, getdate
+from frappe.utils import today, add_days, cint, get_datetime, getdate, now_datetime
+
+
+# Invoices per dunning-history query
+HISTORY_BATCH_SIZE = 1000
+
+# Invoices that are not due for any level yet, e.g. waiting for the previous
+# level's Dunning to be submitted, are checked again after this many days
+RECHECK_DAYS = 7
+
+# Invoices per background job. Chunks never mix companies or split a
+# consolidated Dunning, and all chunks of a run are worked on concurrently.
+DRAFT_CHUNK_SIZE = 50
+DRAFT_CHUNK_TIMEOUT = 30 * 60
+
+# Drafts per commit within a chunk, overridable with the site config key
+# az_it_dunning_commit_batch_size. Every Dunning insert locks its naming
+# series row until the commit, so with larger batches the concurrent chunk
+# jobs queue up on that row and can hit innodb_lock_wait_timeout. Only raise
+# it if a single long worker runs the chunks one after another.
+COMMIT_BATCH_SIZE = 1
+
+# With the site config key az_it_dunning_consolidate_per_customer set, all of a
+# customer's invoices due for the same level go into one Dunning
+CONSOLIDATE_CONFIG_KEY = "az_it_dunning_consolidate_per_customer"
+
+# A run holds the lock from planning until its last chunk has finished; the
+# timeout frees it should a chunk job die before reporting back
+RUN_LOCK_KEY = "az_it:dunning:run_lock"
+RUN_LOCK_TIMEOUT = 6 * 60 * 60
+RUN_KEY_PREFIX = "az_it:dunning:run:"
+
+RUN_DOCTYPE = "Dunning Automation Run"
 
 
 def auto_create_dunnings():
@@ -8,27 +43,338 @@ def auto_create_dunnings():
 	Scans all overdue submitted Sales Invoices and creates draft Dunning
 	documents at the appropriate escalation level (1, 2, or 3).
 	Employees review and submit the drafts manually.
+
+	Planning runs here; the drafts are created by create_dunning_drafts jobs on
+	the long queue, DRAFT_CHUNK_SIZE invoices each, so a large backlog is spread
+	over the available workers instead of running into the scheduler timeout.
+	Every run is recorded as a Dunning Automation Run.
 	"""
-	dunning_types_by_level = _get_dunning_types_by_level()
-	if not dunning_types_by_level:
-		return  # No dunning types configured with custom_dunning_level — skip silently
+	cache = frappe.cache()
+	run_id = frappe.generate_hash(length=10)
+	if not cache.set(cache.make_key(RUN_LOCK_KEY), run_id, nx=True, ex=RUN_LOCK_TIMEOUT):
+		frappe.log_error(
+			f"Run {frappe.safe_decode(cache.get(cache.make_key(RUN_LOCK_KEY)) or '')} still holds the lock.",
+			"Auto Dunning: Previous run still in progress, skipped",
+		)
+		return
 
-	overdue_invoices = _get_overdue_invoices()
+	frappe.get_doc({"doctype": RUN_DOCTYPE, "status": "Running", "started": now_datetime()}).insert(
+		ignore_permissions=True, set_name=run_id
+	)
+	frappe.db.commit()
 
-	for invoice in overdue_invoices:
-		try:
-			_process_invoice(invoice, dunning_types_by_level)
-		except Exception:
-			frappe.log_error(
-				frappe.get_traceback(),
-				f"Auto Dunning: Error processing invoice {invoice.name}",
+	try:
+		metrics = RunMetrics()
+		plan, next_checks = _build_plan(metrics)
+		with metrics.phase("update_next_checks"):
+			_set_next_dunning_checks(next_checks)
+
+		frappe.db.set_value(
+			RUN_DOCTYPE,
+			run_id,
+			{
+				"invoices_scanned": metrics.invoices_scanned,
+				"dunnings_planned": len(plan),
+				"skipped_not_due": metrics.skipped_not_due,
+				"skipped_waiting": metrics.skipped_waiting,
+				"phase_metrics": frappe.as_json(metrics.phases),
+				"total_queries": metrics.total_queries,
+			},
+			update_modified=False,
+		)
+		frappe.db.commit()
+
+		chunks = _partition_plan(plan, consolidate=bool(frappe.conf.get(CONSOLIDATE_CONFIG_KEY)))
+		if not chunks:
+			_finish_run(run_id)
+			return
+
+		cache.set(_get_pending_chunks_key(run_id), len(chunks), ex=RUN_LOCK_TIMEOUT)
+		for chunk in chunks:
+			frappe.enqueue(
+				"az_it.az_it.dunning_automation.create_dunning_drafts",
+				queue="long",
+				timeout=DRAFT_CHUNK_TIMEOUT,
+				run_id=run_id,
+				entries=chunk,
 			)
+	except Exception:
+		frappe.db.rollback()
+		_finish_run(run_id, status="Failed")
+		raise
+
 
+def create_dunning_drafts(run_id, entries):
+	"""
+	Background job: creates the draft Dunnings for one chunk of the plan.
 
-def _get_dunning_types_by_level():
+	Args:
+		run_id: Name of the Dunning Automation Run that enqueued the chunk
+		entries: [[[sales invoice, ...], dunning type, level], ...], one Dunning per entry
 	"""
-	Returns a dict keyed by dunning level: {1: config_dict, 2: config_dict, 3: config_dict}.
+	commit_batch_size = max(cint(frappe.conf.get("az_it_dunning_commit_batch_size") or COMMIT_BATCH_SIZE), 1)
+	counts = {"level_1_drafts": 0, "level_2_drafts": 0, "level_3_drafts": 0, "skipped_nothing_overdue": 0, "errors": 0}
+	committed = dict(counts)
+	metrics = RunMetrics()
+	memo = {}
+
+	try:
+		with metrics.phase("create_drafts"):
+			for i, (invoice_names, dunning_type, level) in enumerate(entries, start=1):
+				try:
+					# A failing draft only rolls back itself, not the uncommitted batch
+					frappe.db.savepoint("az_it_dunning_draft")
+					if _create_dunning_draft(invoice_names, frappe._dict(name=dunning_type), memo):
+						counts[f"level_{level}_drafts"] += 1
+					else:
+						counts["skipped_nothing_overdue"] += len(invoice_names)
+				except Exception:
+					frappe.db.rollback(save_point="az_it_dunning_draft")
+					counts["errors"] += 1
+					frappe.log_error(
+						frappe.get_traceback(),
+						f"Auto Dunning: Error processing invoice {', '.join(invoice_names)}",
+					)
+
+				if i % commit_batch_size == 0:
+					frappe.db.commit()
+					committed = dict(counts)
+		# The last batch is committed together with the counts
+		committed = counts
+	except BaseException:
+		# E.g. the job timeout, or a deadlock that already rolled back the
+		# whole transaction (and with it the savepoint)
+		frappe.db.rollback()
+		frappe.log_error(frappe.get_traceback(), f"Auto Dunning: Draft chunk of run {run_id} failed")
+		committed["failed_chunks"] = 1
+		raise
+	finally:
+		# Also runs for failed chunks, so the run still completes and releases
+		# its lock; only a killed worker leaves that to RUN_LOCK_TIMEOUT
+		phase = metrics.phases.get("create_drafts", {})
+		committed.update(draft_seconds=phase.get("seconds", 0), draft_queries=phase.get("queries", 0))
+		_record_chunk(run_id, committed)
+
+
+def _record_chunk(run_id, counts):
+	"""Adds a finished (or failed) chunk's counts to the run; the last chunk finishes the run."""
+	try:
+		# Relative updates, since chunks of the same run finish concurrently
+		run = frappe.qb.DocType(RUN_DOCTYPE)
+		query = frappe.qb.update(run).where(run.name == run_id)
+		for fieldname, value in counts.items():
+			query = query.set(run[fieldname], run[fieldname] + value)
+		query.run()
+		frappe.db.commit()
+	finally:
+		# The job that finishes the last chunk completes the run
+		if frappe.cache().decr(_get_pending_chunks_key(run_id)) <= 0:
+			_finish_run(run_id)
+
+
+def _finish_run(run_id, status="Completed"):
+	# Locked, so that the last chunk and a failing planner can't both finish the run
+	if frappe.db.get_value(RUN_DOCTYPE, run_id, "status", for_update=True) != "Running":
+		# Already finished, e.g. chunks enqueued before the planner failed
+		frappe.db.rollback()
+		frappe.cache().delete(_get_pending_chunks_key(run_id))
+		return
+
+	run = frappe.get_doc(RUN_DOCTYPE, run_id)
+	finished = now_datetime()
+	if run.failed_chunks:
+		status = "Failed"
+
+	phases = frappe.parse_json(run.phase_metrics or "{}")
+	if run.draft_seconds or run.draft_queries:
+		phases["create_drafts"] = {"seconds": run.draft_seconds, "queries": run.draft_queries}
+
+	run.db_set(
+		{
+			"status": status,
+			"finished": finished,
+			"wall_time_seconds": round((finished - get_datetime(run.started)).total_seconds(), 3),
+			"phase_metrics": frappe.as_json(phases),
+			"total_queries": sum(cint(phase.get("queries")) for phase in phases.values()),
+		},
+		update_modified=False,
+	)
+	frappe.db.commit()
+
+	frappe.cache().delete(_get_pending_chunks_key(run_id))
+	_release_run_lock(run_id)
+
+
+def _partition_plan(plan, consolidate=False):
+	"""
+	Splits the plan into the entries of the create_dunning_drafts jobs.
+
+	Each chunk holds invoices of a single company. With consolidate, the
+	invoices of one customer that are due for the same Dunning Type (and share
+	a currency) become a single entry, i.e. a single Dunning.
+	"""
+	dunnings = {}
+	for entry in plan:
+		invoice = entry.invoice
+		if consolidate:
+			key = (invoice.company, invoice.customer, invoice.currency, entry.dunning_type.name)
+		else:
+			key = (invoice.company, invoice.name)
+		dunnings.setdefault(key, [[], entry.dunning_type.name, entry.dunning_type.custom_dunning_level])[0].append(
+			invoice.name
+		)
+
+	chunks = []
+	chunk, chunk_company, chunk_size = [], None, 0
+	for key in sorted(dunnings):
+		company = key[0]
+		if chunk and (company != chunk_company or chunk_size >= DRAFT_CHUNK_SIZE):
+			chunks.append(chunk)
+			chunk, chunk_size = [], 0
+		chunk.append(dunnings[key])
+		chunk_company = company
+		chunk_size += len(dunnings[key][0])
+
+	if chunk:
+		chunks.append(chunk)
+
+	return chunks
+
+
+def _get_pending_chunks_key(run_id):
+	# A plain Redis integer, so that chunks can count down atomically
+	return frappe.cache().make_key(f"{RUN_KEY_PREFIX}{run_id}:pending_chunks")
+
+
+def _release_run_lock(run_id):
+	cache = frappe.cache()
+	lock_key = cache.make_key(RUN_LOCK_KEY)
+	if frappe.safe_decode(cache.get(lock_key) or "") == run_id:
+		cache.delete(lock_key)
+
+
+@frappe.whitelist()
+def get_dunning_plan():
+	"""
+	Dry run of auto_create_dunnings: runs the full level 1/2/3 decision logic
+	without inserting anything. Returns the plan (invoice → level, dunning type,
+	trigger date) plus wall time and query count per phase.
+	"""
+	frappe.only_for(("System Manager", "Accounts Manager"))
+
+	metrics = RunMetrics()
+	plan, next_checks = _build_plan(metrics)
+
+	return {
+		"invoices_scanned": metrics.invoices_scanned,
+		"plan": [
+			{
+				"invoice": entry.invoice.name,
+				"customer": entry.invoice.customer,
+				"company": entry.invoice.company,
+				"outstanding_amount": entry.invoice.outstanding_amount,
+				"level": entry.dunning_type.custom_dunning_level,
+				"dunning_type": entry.dunning_type.name,
+				"trigger_date": entry.trigger_date,
+			}
+			for entry in plan
+		],
+		"next_checks": {invoice: str(check_date) for invoice, check_date in next_checks.items()},
+		"phases": metrics.phases,
+		"total_seconds": metrics.total_seconds,
+		"total_queries": metrics.total_queries,
+	}
+
+
+class RunMetrics:
+	"""Wall time and query count per phase of a dunning run."""
+
+	def __init__(self):
+		self.phases = {}
+		self.invoices_scanned = 0
+		self.skipped_not_due = 0
+		self.skipped_waiting = 0
+
+	@property
+	def total_seconds(self):
+		return round(sum(phase["seconds"] for phase in self.phases.values()), 3)
+
+	@property
+	def total_queries(self):
+		return sum(phase["queries"] for phase in self.phases.values())
+
+	@contextmanager
+	def phase(self, name):
+		# Queries are counted by wrapping frappe.db.sql, which frappe.qb and
+		# frappe.get_all also go through (same approach as assertQueryCount)
+		db = frappe.db
+		sql = db.sql
+		queries = 0
+
+		def counting_sql(*args, **kwargs):
+			nonlocal queries
+			queries += 1
+			return sql(*args, **kwargs)
+
+		db.sql = counting_sql
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			db.sql = sql
+			phase = self.phases.setdefault(name, {"seconds": 0, "queries": 0})
+			phase["seconds"] = round(phase["seconds"] + time.perf_counter() - start, 3)
+			phase["queries"] += queries
+
+
+def _build_plan(metrics):
+	"""
+	Decides which dunnings are due today, without writing anything.
+
+	Returns (plan, next_checks): plan lists the due dunnings as
+	{invoice, dunning_type (config), trigger_date}; next_checks maps every
+	scanned invoice that is not due to the date it needs to be looked at again
+	(its custom_next_dunning_check).
+	"""
+	with metrics.phase("load_dunning_types"):
+		dunning_types_by_company = _get_dunning_types_by_company()
+	if not dunning_types_by_company:
+		return [], {}  # No dunning types configured with custom_dunning_level — skip silently
+
+	with metrics.phase("load_invoices"):
+		overdue_invoices = _get_overdue_invoices()
+	metrics.invoices_scanned = len(overdue_invoices)
+
+	with metrics.phase("load_history"):
+		history = _get_dunning_history([invoice.name for invoice in overdue_invoices])
+
+	plan = []
+	next_checks = {}
+	with metrics.phase("decide"):
+		today_date = getdate(today())
+		for invoice in overdue_invoices:
+			dunning_types_by_level = dunning_types_by_company.get(invoice.company) or dunning_types_by_company.get(None, {})
+			dunning_type, trigger_date = _get_next_dunning(invoice, dunning_types_by_level, history.get(invoice.name, {}))
+			if dunning_type and trigger_date <= today_date:
+				# The check date stays due, so a failed draft is retried on the next run
+				plan.append(frappe._dict(invoice=invoice, dunning_type=dunning_type, trigger_date=trigger_date))
+			elif dunning_type:
+				next_checks[invoice.name] = trigger_date
+				metrics.skipped_not_due += 1
+			else:
+				next_checks[invoice.name] = getdate(add_days(today_date, RECHECK_DAYS))
+				metrics.skipped_waiting += 1
+
+	return plan, next_checks
+
+
+def _get_dunning_types_by_company():
+	"""
+	Returns the level maps per company: {company: {1: config_dict, 2: config_dict, 3: config_dict}}.
 	Only returns Dunning Types that have custom_dunning_level set.
+
+	Dunning Types without a company apply to every company (key None); a
+	company's own Dunning Type takes precedence for its level.
 	"""
 	dunning_types = frappe.get_all(
 		"Dunning Type",
@@ -44,135 +390,183 @@ def _get_dunning_types_by_level():
 			"cost_center",
 		],
 	)
-	result = {}
+	by_company = {}
 	for dt in dunning_types:
-		level = dt.custom_dunning_level
-		if level not in result:
-			result[level] = dt
-	return result
+		by_company.setdefault(dt.company or None, {}).setdefault(dt.custom_dunning_level, dt)
+
+	defaults = by_company.get(None, {})
+	return {company: {**defaults, **levels} for company, levels in by_company.items()}
 
 
 def _get_overdue_invoices():
-	"""Returns all submitted, non-return Sales Invoices with outstanding_amount > 0."""
-	return frappe.get_all(
-		"Sales Invoice",
-		filters={
-			"docstatus": 1,
-			"outstanding_amount": [">", 0],
-			"is_return": 0,
-		},
-		fields=["name", "customer", "company", "due_date", "outstanding_amount", "currency", "language"],
-	)
+	"""
+	Returns the submitted, non-return Sales Invoices with outstanding_amount > 0
+	whose custom_next_dunning_check is today or earlier (or not set yet).
+	"""
+	si = frappe.qb.DocType("Sales Invoice")
+	return (
+		frappe.qb.from_(si)
+		.select(si.name, si.customer, si.company, si.due_date, si.outstanding_amount, si.currency, si.language)
+		.where(si.docstatus == 1)
+		.where(si.outstanding_amount > 0)
+		.where(si.is_return == 0)
+		# Plain IS NULL / <= (no IFNULL wrapper as in get_all filters) so the index applies
+		.where(si.custom_next_dunning_check.isnull() | (si.custom_next_dunning_check <= today()))
+	).run(as_dict=True)
 
 
-def _process_invoice(invoice, dunning_types_by_level):
+def _get_dunning_history(invoice_names):
 	"""
-	Determines the correct dunning level for a single invoice and creates a
-	draft Dunning document if the timing conditions are met and no duplicate exists.
+	Loads all non-cancelled Dunnings with a configured level for the given
+	invoices, one 3-table join (Dunning → Overdue Payment → Dunning Type) per
+	HISTORY_BATCH_SIZE invoices instead of several joins per invoice.
 
-	Level 1: triggered N days after invoice due_date.
-	Level 2: triggered N days after the submitted Level 1 dunning's posting_date.
-	Level 3: triggered N days after the submitted Level 2 dunning's posting_date.
+	Returns {invoice: {level: {"submitted_posting_date": date or None}}};
+	a level key is present if any draft or submitted Dunning exists at that level.
 	"""
-	if not invoice.due_date:
-		return  # skip invoices with no due date
+	history = {}
+	for i in range(0, len(invoice_names), HISTORY_BATCH_SIZE):
+		rows = _get_dunning_history_query(invoice_names[i : i + HISTORY_BATCH_SIZE]).run(as_dict=True)
 
-	today_date = getdate(today())
+		for row in rows:
+			levels = history.setdefault(row.sales_invoice, {})
+			entry = levels.setdefault(row.custom_dunning_level, frappe._dict(submitted_posting_date=None))
+			if row.docstatus == 1:
+				posting_date = getdate(row.posting_date)
+				if not entry.submitted_posting_date or posting_date > entry.submitted_posting_date:
+					entry.submitted_posting_date = posting_date
 
-	# --- Level 1 ---
-	l1 = dunning_types_by_level.get(1)
-	if l1:
-		trigger_date = getdate(add_days(invoice.due_date, l1.custom_days_trigger if l1.custom_days_trigger is not None else 30))
-		if today_date >= trigger_date:
-			if not _get_existing_dunning(invoice.name, 1):
-				_create_dunning_draft(invoice, l1)
-				return  # One level per run
-
-	# --- Level 2 (only if Level 1 has been submitted/sent) ---
-	l2 = dunning_types_by_level.get(2)
-	if l2:
-		submitted_l1 = _get_submitted_dunning(invoice.name, 1)
-		if submitted_l1:
-			trigger_date = getdate(add_days(submitted_l1.posting_date, l2.custom_days_trigger if l2.custom_days_trigger is not None else 10))
-			if today_date >= trigger_date:
-				if not _get_existing_dunning(invoice.name, 2):
-					_create_dunning_draft(invoice, l2)
-					return
-
-	# --- Level 3 (only if Level 2 has been submitted/sent) ---
-	l3 = dunning_types_by_level.get(3)
-	if l3:
-		submitted_l2 = _get_submitted_dunning(invoice.name, 2)
-		if submitted_l2:
-			trigger_date = getdate(add_days(submitted_l2.posting_date, l3.custom_days_trigger if l3.custom_days_trigger is not None else 10))
-			if today_date >= trigger_date:
-				if not _get_existing_dunning(invoice.name, 3):
-					_create_dunning_draft(invoice, l3)
-
-
-def _get_existing_dunning(sales_invoice_name, level):
-	"""
-	Returns a dunning record if any non-cancelled Dunning at the given level
-	exists for the invoice (draft or submitted both count as existing).
-	Uses a 3-table join: Dunning → Overdue Payment → Dunning Type.
-	"""
+	return history
+
+
+def _get_dunning_history_query(invoice_names):
+	# Served by the (sales_invoice, parent) index on Overdue Payment, see
+	# az_it.az_it.setup.indexes.ensure_dunning_indexes
 	dunning = frappe.qb.DocType("Dunning")
 	op = frappe.qb.DocType("Overdue Payment")
 	dt = frappe.qb.DocType("Dunning Type")
 
-	result = (
+	return (
 		frappe.qb.from_(dunning)
 		.join(op)
 		.on(op.parent == dunning.name)
 		.join(dt)
 		.on(dt.name == dunning.dunning_type)
-		.select(dunning.name, dunning.posting_date)
-		.where(op.sales_invoice == sales_invoice_name)
-		.where(dt.custom_dunning_level == level)
+		.select(op.sales_invoice, dt.custom_dunning_level, dunning.docstatus, dunning.posting_date)
+		.where(op.sales_invoice.isin(invoice_names))
+		.where(dt.custom_dunning_level > 0)
 		.where(dunning.docstatus != 2)  # exclude cancelled
-		.limit(1)
-	).run(as_dict=True)
-
-	return result[0] if result else None
+	)
 
 
-def _get_submitted_dunning(sales_invoice_name, level):
+def _get_next_dunning(invoice, dunning_types_by_level, history):
 	"""
-	Returns the submitted (docstatus=1) Dunning at the given level for the invoice.
-	Used to check whether the prior level has been sent before escalating.
+	Decides in memory which dunning level comes next for a single invoice.
+	Returns (dunning type config, trigger date), or (None, None) if no level can
+	be scheduled yet; the level is due once the trigger date is reached.
+
+	Level 1: triggered N days after invoice due_date.
+	Level 2: triggered N days after the submitted Level 1 dunning's posting_date.
+	Level 3: triggered N days after the submitted Level 2 dunning's posting_date.
+	A level is skipped if a non-cancelled dunning already exists for it.
 	"""
-	dunning = frappe.qb.DocType("Dunning")
-	op = frappe.qb.DocType("Overdue Payment")
-	dt = frappe.qb.DocType("Dunning Type")
+	if not invoice.due_date:
+		return None, None  # skip invoices with no due date
+
+	# --- Level 1 ---
+	l1 = dunning_types_by_level.get(1)
+	if l1 and 1 not in history:
+		trigger_date = getdate(add_days(invoice.due_date, l1.custom_days_trigger if l1.custom_days_trigger is not None else 30))
+		return l1, trigger_date
+
+	# --- Level 2 and 3 (only if the previous level has been submitted/sent) ---
+	for level in (2, 3):
+		config = dunning_types_by_level.get(level)
+		previous = history.get(level - 1)
+		if not config or level in history or not previous or not previous.submitted_posting_date:
+			continue
+
+		trigger_date = getdate(add_days(previous.submitted_posting_date, config.custom_days_trigger if config.custom_days_trigger is not None else 10))
+		return config, trigger_date
+
+	return None, None
 
-	result = (
-		frappe.qb.from_(dunning)
-		.join(op)
-		.on(op.parent == dunning.name)
-		.join(dt)
-		.on(dt.name == dunning.dunning_type)
-		.select(dunning.name, dunning.posting_date)
-		.where(op.sales_invoice == sales_invoice_name)
-		.where(dt.custom_dunning_level == level)
-		.where(dunning.docstatus == 1)  # only submitted
-		.limit(1)
-	).run(as_dict=True)
 
-	return result[0] if result else None
+def _set_next_dunning_checks(next_checks):
+	"""Writes custom_next_dunning_check, one UPDATE per distinct date and HISTORY_BATCH_SIZE invoices."""
+	invoices_by_date = {}
+	for invoice, check_date in next_checks.items():
+		invoices_by_date.setdefault(check_date, []).append(invoice)
 
+	si = frappe.qb.DocType("Sales Invoice")
+	for check_date, invoices in invoices_by_date.items():
+		for i in range(0, len(invoices), HISTORY_BATCH_SIZE):
+			(
+				frappe.qb.update(si)
+				.set(si.custom_next_dunning_check, check_date)
+				.where(si.name.isin(invoices[i : i + HISTORY_BATCH_SIZE]))
+			).run()
 
-def _create_dunning_draft(invoice, dunning_type_config):
+
+def _reset_next_dunning_checks(invoices):
+	"""Makes the next daily run look at the given Sales Invoices again."""
+	invoices = list({invoice for invoice in invoices if invoice})
+	if invoices:
+		_set_next_dunning_checks(dict.fromkeys(invoices, getdate(today())))
+
+
+def set_next_dunning_check(doc, method=None):
+	"""Sales Invoice on_submit: nothing can be dunned before the due date."""
+	doc.db_set("custom_next_dunning_check", doc.due_date or today(), update_modified=False)
+
+
+def reset_next_dunning_check_for_payment(doc, method=None):
+	"""Payment Entry on_submit / on_cancel: outstanding amounts of the paid invoices changed."""
+	_reset_next_dunning_checks(
+		ref.reference_name for ref in doc.get("references") or [] if ref.reference_doctype == "Sales Invoice"
+	)
+
+
+def reset_next_dunning_check_for_dunning(doc, method=None):
+	"""Dunning on_submit / on_cancel / on_trash: the dunned invoices' next level changed."""
+	_reset_next_dunning_checks(row.sales_invoice for row in doc.get("overdue_payments") or [])
+
+
+def reset_all_next_dunning_checks(doc, method=None):
+	"""Dunning Type on_update: changed levels or trigger days invalidate all check dates."""
+	if not doc.get("custom_dunning_level"):
+		return
+
+	si = frappe.qb.DocType("Sales Invoice")
+	(
+		frappe.qb.update(si)
+		.set(si.custom_next_dunning_check, None)
+		.where(si.docstatus == 1)
+		.where(si.outstanding_amount > 0)
+	).run()
+
+
+def _create_dunning_draft(invoice_names, dunning_type_config, memo=None):
 	"""
 	Creates and saves (docstatus=0) a draft Dunning document for the given
-	Sales Invoice using the specified Dunning Type configuration.
+	Sales Invoices using the specified Dunning Type configuration. Several
+	invoices (of one customer) are consolidated into one Dunning, with the
+	overdue payments of all of them.
 
 	Reuses ERPNext's get_mapped_doc pattern from sales_invoice.create_dunning()
 	but selects the dunning type by custom_dunning_level instead of is_default.
+
+	memo caches Dunning Types and letter templates across the drafts of one
+	run (see _get_dunning_type and _get_letter_template).
+
+	Does not commit; create_dunning_drafts commits in batches.
+
+	Returns the new Dunning, or None if the invoices have no overdue schedule rows.
 	"""
 	from frappe.model.mapper import get_mapped_doc
-	from erpnext.accounts.doctype.dunning.dunning import get_dunning_letter_text
 
-	dunning_type_doc = frappe.get_doc("Dunning Type", dunning_type_config.name)
+	memo = {} if memo is None else memo
+	dunning_type_doc = _get_dunning_type(dunning_type_config.name, memo)
 
 	def postprocess(source, target):
 		target.dunning_type = dunning_type_doc.name
@@ -181,43 +575,70 @@ def _create_dunning_draft(invoice, dunning_type_config):
 		target.income_account = dunning_type_doc.income_account
 		target.cost_center = dunning_type_doc.cost_center
 
-		letter_text = get_dunning_letter_text(
-			dunning_type=dunning_type_doc.name,
-			doc=target.as_dict(),
-			language=source.language,
-		)
-		if letter_text:
-			target.body_text = letter_text.get("body_text")
-			target.closing_text = letter_text.get("closing_text")
-			target.language = letter_text.get("language")
+		letter_template = _get_letter_template(dunning_type_doc, source.language or target.language, memo)
+		if letter_template:
+			# Rendered per document, like erpnext's get_dunning_letter_text
+			context = target.as_dict()
+			target.body_text = frappe.render_template(letter_template.body_text, context)
+			target.closing_text = frappe.render_template(letter_template.closing_text, context)
+			target.language = letter_template.language
 
 		# Adjust outstanding for invoices with a single payment schedule row
 		if source.payment_schedule and len(source.payment_schedule) == 1:
-			if target.overdue_payments:
-				target.overdue_payments[0].outstanding = source.get("outstanding_amount")
+			for row in target.overdue_payments:
+				if row.sales_invoice == source.name:
+					row.outstanding = source.get("outstanding_amount")
 
 		target.validate()
 
-	dunning = get_mapped_doc(
-		from_doctype="Sales Invoice",
-		from_docname=invoice.name,
-		table_maps={
-			"Sales Invoice": {
-				"doctype": "Dunning",
-				"field_map": {"customer_address": "customer_address", "parent": "sales_invoice"},
+	dunning = None
+	for invoice_name in invoice_names:
+		# Mapping onto the same target appends each invoice's overdue payments
+		dunning = get_mapped_doc(
+			from_doctype="Sales Invoice",
+			from_docname=invoice_name,
+			table_maps={
+				"Sales Invoice": {
+					"doctype": "Dunning",
+					"field_map": {"customer_address": "customer_address", "parent": "sales_invoice"},
+				},
+				"Payment Schedule": {
+					"doctype": "Overdue Payment",
+					"field_map": {"name": "payment_schedule", "parent": "sales_invoice"},
+					"condition": lambda doc: doc.outstanding > 0 and getdate(doc.due_date) < getdate(),
+				},
 			},
-			"Payment Schedule": {
-				"doctype": "Overdue Payment",
-				"field_map": {"name": "payment_schedule", "parent": "sales_invoice"},
-				"condition": lambda doc: doc.outstanding > 0 and getdate(doc.due_date) < getdate(),
-			},
-		},
-		postprocess=postprocess,
-		ignore_permissions=True,
-	)
+			target_doc=dunning,
+			postprocess=postprocess,
+			ignore_permissions=True,
+		)
 
-	if not dunning.overdue_payments:
-		return  # No overdue payment schedule rows — nothing to dun
+	if not dunning or not dunning.overdue_payments:
+		return None  # No overdue payment schedule rows — nothing to dun
 
 	dunning.insert(ignore_permissions=True)
-	frappe.db.commit()
+	return dunning
+
+
+def _get_dunning_type(name, memo):
+	"""Dunning Type document, loaded once per run."""
+	key = ("Dunning Type", name)
+	if key not in memo:
+		memo[key] = frappe.get_doc("Dunning Type", name)
+	return memo[key]
+
+
+def _get_letter_template(dunning_type_doc, language, memo):
+	"""
+	Unrendered Dunning Letter Text of the Dunning Type for the given language,
+	falling back to the default language row — the same selection as erpnext's
+	get_dunning_letter_text, read from the cached Dunning Type instead of the
+	database. Cached per (dunning type, language).
+	"""
+	key = ("Dunning Letter Text", dunning_type_doc.name, language)
+	if key not in memo:
+		rows = dunning_type_doc.get("dunning_letter_text") or []
+		memo[key] = next((row for row in rows if language and row.language == language), None) or next(
+			(row for row in rows if row.is_default_language), None
+		)
+	return memo[key]
@@ -36,6 +36,13 @@ frappe.ui.form.on('Sales Order', {
             }
         });
 
+        // Apply one discount to many rows in a single server call
+        if (!frm.is_new() && frm.doc.docstatus === 0) {
+            frm.add_custom_button(__('Rabatt auf Positionen'), function() {
+                apply_bulk_discount_sales_order(frm);
+            });
+        }
+
         // Add button to create new WA Nummer from Sales Order
         if (!frm.is_new() && frm.doc.customer && frm.doc.docstatus === 1) {
             frm.add_custom_button(__('Create WA Nummer'), function() {
@@ -287,3 +294,62 @@ function remove_discount_line_sales_order(description) {
 
     return cleaned;
 }
+
+// Bulk discount: selected rows (or all rows), optionally limited to an item group
+function apply_bulk_discount_sales_order(frm) {
+    if (frm.is_dirty()) {
+        frappe.msgprint(__('Bitte speichern Sie das Dokument zuerst.'));
+        return;
+    }
+
+    let selected = frm.fields_dict.items.grid.get_selected();
+    let dialog = new frappe.ui.Dialog({
+        title: __('Rabatt auf Positionen'),
+        fields: [
+            {
+                fieldname: 'discount',
+                fieldtype: 'Int',
+                label: __('Rabatt in %'),
+                reqd: 1
+            },
+            {
+                fieldname: 'item_group',
+                fieldtype: 'Link',
+                options: 'Item Group',
+                label: __('Nur Artikelgruppe')
+            }
+        ],
+        primary_action_label: selected.length
+            ? __('Auf {0} ausgewählte Positionen anwenden', [selected.length])
+            : __('Auf alle Positionen anwenden'),
+        primary_action: function(values) {
+            if (values.discount < 0 || values.discount > 100) {
+                frappe.msgprint(__('Rabatt muss zwischen 0 und 100% liegen'));
+                return;
+            }
+            dialog.hide();
+
+            frappe.call({
+                method: 'az_it.az_it.python_scripts.overrides.discount_engine.apply_bulk_discount',
+                args: {
+                    doctype: frm.doctype,
+                    name: frm.doc.name,
+                    discount: values.discount,
+                    rows: selected.length ? selected : null,
+                    item_group: values.item_group || null
+                },
+                freeze: true,
+                callback: function(r) {
+                    if (r.message) {
+                        frm.reload_doc();
+                        frappe.show_alert({
+                            message: __('Rabatt auf {0} Positionen angewendet', [r.message.updated]),
+                            indicator: 'green'
+                        });
+                    }
+                }
+            });
+        }
+    });
+    dialog.show();
+}
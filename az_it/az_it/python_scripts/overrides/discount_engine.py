@@ -0,0 +1,359 @@
+# Custom Discount Validation for Quotation, Sales Order, Delivery Note and Sales Invoice
+# Copyright (c) 2026, ahmad mohammad and contributors
+
+import frappe
+from frappe import _
+from functools import lru_cache
+import re
+
+
+# Doctypes whose items arrive with an already discounted rate (copied from
+# the Sales Order), so a missing ausgangspreis is reverse-calculated
+REVERSE_CALCULATE_DOCTYPES = ("Delivery Note",)
+
+# Template of the discount line, filled with the whole percent
+DISCOUNT_HTML = '<p style="color: red; font-weight: bold;">inklusive {0}% Rabatt</p>'
+BLANK_LINE_HTML = '<p><br></p>'
+
+# Item field holding the percent whose discount line is rendered into the
+# description (0: none, -1, the field default: not rendered yet). Rows whose
+# discount equals it and whose description is unchanged need no description
+# scan at all.
+RENDERED_FIELD = 'custom_rabatt_gerendert'
+
+# Doctypes apply_bulk_discount works on
+BULK_DISCOUNT_DOCTYPES = ("Quotation", "Sales Order")
+
+# Rendered descriptions kept per worker process; the same article text recurs
+# across many rows and documents
+DESCRIPTION_CACHE_SIZE = 2048
+
+# Patterns are compiled once at import instead of on every item row
+DISCOUNT_LINE_PATTERN = r'<p[^>]*style="[^"]*color:\s*red[^"]*"[^>]*>inklusive\s+\d+%\s+Rabatt</p>'
+DISCOUNT_LINE_RE = re.compile(DISCOUNT_LINE_PATTERN, re.IGNORECASE)
+DISCOUNT_PERCENT_RE = re.compile(r'inklusive\s+(\d+)%\s+Rabatt', re.IGNORECASE)
+# The red paragraph first, so that its <p> wrapper goes along with the text
+DISCOUNT_REMOVAL_RE = re.compile(DISCOUNT_LINE_PATTERN + r'|inklusive\s+\d+%\s+Rabatt', re.IGNORECASE)
+BLANK_LINE_RUN_RE = re.compile(r'(<p>\s*(?:<br\s*/?>\s*)?</p>\s*){2,}', re.IGNORECASE)
+BLANK_LINE_RE = re.compile(r'<p>\s*(?:<br\s*/?>\s*)?</p>', re.IGNORECASE)
+NEWLINE_RUN_RE = re.compile(r'\n{3,}')
+BOLD_CLOSE_RE = re.compile(r'</strong>|</b>', re.IGNORECASE)
+PARAGRAPH_CLOSE_RE = re.compile(r'</p>', re.IGNORECASE)
+NAME_END_RE = re.compile(r'</(?:strong|b)>\s*</p>', re.IGNORECASE)
+RED_PARAGRAPH_RE = re.compile(r'<p[^>]*style="[^"]*color:\s*red', re.IGNORECASE)
+
+
+def validate_custom_discount(doc, method=None):
+    """
+    Validate custom discount fields in sales document items.
+
+    - Ensures discount percentage is between 0-100
+    - Validates that rate matches calculation: ausgangspreis * (1 - discount/100)
+    - Ensures description contains discount line when discount > 0
+
+    Shared by Quotation, Sales Order, Delivery Note and Sales Invoice so that
+    the discount text persists through the full SO -> DN -> SI chain.
+
+    Rows whose rate, discount, ausgangspreis and description are unchanged
+    since the last save were validated then and are skipped. The description
+    of a saved row is only rendered again if the discount differs from the
+    rendered one (custom_rabatt_gerendert) or the description was edited;
+    unsaved rows are always rendered.
+
+    Args:
+        doc: Quotation, Sales Order, Delivery Note or Sales Invoice document
+        method: Hook method name
+    """
+    reverse_calculate = doc.doctype in REVERSE_CALCULATE_DOCTYPES
+    previous_inputs = _get_previous_inputs(doc)
+
+    for item in doc.items:
+        # Skip if custom fields don't exist (app may run standalone)
+        if not hasattr(item, 'custom_rabatt_in_prozent'):
+            continue
+
+        inputs = _get_inputs(item)
+        previous = previous_inputs.get(item.name) if item.name else None
+        if previous == inputs:
+            continue
+
+        discount = float(item.custom_rabatt_in_prozent or 0)
+        ausgangspreis = float(item.custom_ausgangspreis or 0)
+
+        # Validate discount range
+        if discount < 0 or discount > 100:
+            frappe.throw(
+                _("Row {0}: Rabatt muss zwischen 0 und 100% liegen").format(item.idx),
+                title=_("Ungültiger Rabatt")
+            )
+
+        # Validate calculation if discount is applied
+        if discount > 0:
+            if not ausgangspreis:
+                if reverse_calculate and discount < 100:
+                    # Reverse-calculate original price from already-discounted rate
+                    item.custom_ausgangspreis = item.rate / (1 - discount / 100)
+                else:
+                    # Auto-set ausgangspreis if missing
+                    item.custom_ausgangspreis = item.rate
+                ausgangspreis = item.custom_ausgangspreis
+
+            expected_rate = ausgangspreis * (1 - discount / 100)
+            actual_rate = float(item.rate)
+
+            # Allow small rounding differences (0.01)
+            if abs(expected_rate - actual_rate) > 0.01:
+                # Auto-correct rate
+                item.rate = expected_rate
+
+        # Rows without a saved version (new or copied documents, new rows) may
+        # carry a copied custom_rabatt_gerendert with a fetched description
+        description_edited = previous is None or previous[3] != inputs[3]
+        if item.get(RENDERED_FIELD) == discount and not description_edited:
+            continue
+
+        item.description = render_description(item.description, discount)
+        item.set(RENDERED_FIELD, int(discount) if discount > 0 else 0)
+
+
+@frappe.whitelist()
+def apply_bulk_discount(doctype, name, discount, rows=None, item_group=None):
+    """
+    Applies one discount to many rows of a draft Quotation or Sales Order and
+    saves the document once; validate_custom_discount then renders the
+    descriptions.
+
+    Args:
+        doctype: Quotation or Sales Order
+        name: Document name
+        discount: Discount in percent (0 removes the discount)
+        rows: JSON list of item row names; all rows if empty
+        item_group: Only rows of this Item Group
+    """
+    if doctype not in BULK_DISCOUNT_DOCTYPES:
+        frappe.throw(_("Sammelrabatt ist nur für Angebote und Aufträge möglich"))
+
+    discount = float(discount or 0)
+    if discount < 0 or discount > 100:
+        frappe.throw(_("Rabatt muss zwischen 0 und 100% liegen"), title=_("Ungültiger Rabatt"))
+
+    doc = frappe.get_doc(doctype, name)
+    if doc.docstatus != 0:
+        frappe.throw(_("Rabatte können nur im Entwurf geändert werden"))
+
+    rows = set(frappe.parse_json(rows)) if rows else None
+    items = [
+        item
+        for item in doc.items
+        if (rows is None or item.name in rows) and (not item_group or item.item_group == item_group)
+    ]
+    if not items:
+        frappe.throw(_("Keine passenden Positionen gefunden"))
+
+    for item in items:
+        # Same as changing custom_rabatt_in_prozent in the form
+        if not float(item.custom_ausgangspreis or 0):
+            item.custom_ausgangspreis = item.rate
+        item.custom_rabatt_in_prozent = discount
+        item.rate = float(item.custom_ausgangspreis) * (1 - discount / 100)
+
+    doc.save()
+
+    return {"updated": len(items)}
+
+
+def discount_line(item):
+    """
+    Jinja method: the discount line of a sales document item, rendered from
+    its fields, e.g. for print formats that show item_name instead of the
+    description.
+    """
+    discount = float(item.get('custom_rabatt_in_prozent') or 0)
+    return DISCOUNT_HTML.format(int(discount)) if discount > 0 else ''
+
+
+def _get_previous_inputs(doc):
+    """{row name: inputs} of the saved version of doc, empty for new documents."""
+    before = doc.get_doc_before_save() if hasattr(doc, 'get_doc_before_save') else None
+    if not before:
+        return {}
+
+    return {item.name: _get_inputs(item) for item in before.get('items') or []}
+
+
+def _get_inputs(item):
+    # Everything validate_custom_discount reads from a row. Descriptions are
+    # compared as strings, which stops at the first difference (a hash would
+    # have to read both in full).
+    return (
+        float(item.rate or 0),
+        float(item.get('custom_rabatt_in_prozent') or 0),
+        float(item.get('custom_ausgangspreis') or 0),
+        item.description or '',
+    )
+
+
+def render_description(description, discount_percent):
+    """
+    Returns the item description with the discount line in place.
+
+    discount > 0: the red discount line sits after the bold name paragraph,
+    followed by a blank line; any other discount line is removed.
+    discount = 0: all discount text is removed.
+    In both cases a blank line follows the bold name paragraph.
+
+    Not a single scan: finding the current line, removing discount text
+    (three substitutions), locating the name paragraph and checking the
+    blank line after it each search the description again. All patterns are
+    precompiled, and results are memoized per (description, discount) since
+    the transformation depends on nothing else, so a recurring description
+    is only scanned on its first rendering.
+    """
+    return _render_description(description, float(discount_percent or 0))
+
+
+def get_description_cache_info():
+    """Hit/miss counters and size of the render_description memo of this process."""
+    return _render_description.cache_info()._asdict()
+
+
+@lru_cache(maxsize=DESCRIPTION_CACHE_SIZE)
+def _render_description(description, discount_percent):
+    if discount_percent > 0:
+        if has_discount_in_description(description, discount_percent):
+            description = ensure_blank_line_after_discount(description)
+        else:
+            description = _insert_discount_line(remove_discount_from_description(description), discount_percent)
+    elif description:
+        description = remove_discount_from_description(description)
+
+    return ensure_blank_line_after_name(description)
+
+
+def has_discount_in_description(description, discount_percent):
+    """Check if description contains the discount line."""
+    if not description:
+        return False
+
+    percent = str(int(discount_percent))
+    return any(match.group(1) == percent for match in DISCOUNT_PERCENT_RE.finditer(description))
+
+
+def add_discount_to_description(description, discount_percent):
+    """Add discount line to description at second line position."""
+    # Remove existing discount lines first
+    description = remove_discount_from_description(description)
+
+    insert_pos = _find_discount_position(description)
+    discount_html = DISCOUNT_HTML.format(int(discount_percent))
+    if insert_pos is None:
+        # Fallback: append at end
+        return description + discount_html
+
+    # Insert at found position (no surrounding \n to avoid extra whitespace text nodes)
+    return description[:insert_pos] + discount_html + description[insert_pos:]
+
+
+def remove_discount_from_description(description):
+    """Remove discount line from description."""
+    if not description:
+        return ''
+
+    # Remove HTML and plain text discount lines in one pass
+    cleaned = DISCOUNT_REMOVAL_RE.sub('', description)
+
+    # Collapse consecutive blank paragraphs into one
+    cleaned = BLANK_LINE_RUN_RE.sub(BLANK_LINE_HTML, cleaned)
+
+    # Clean up extra whitespace
+    return NEWLINE_RUN_RE.sub('\n\n', cleaned).strip()
+
+
+def ensure_blank_line_after_discount(description):
+    """Restore blank <p></p> after discount paragraph if accidentally deleted."""
+    if not description:
+        return description
+
+    match = DISCOUNT_LINE_RE.search(description)
+    if not match:
+        return description
+
+    if _starts_with_blank_line(description, match.end()):
+        return description
+
+    return description[:match.end()] + BLANK_LINE_HTML + description[match.end():]
+
+
+def ensure_blank_line_after_name(description):
+    """Ensure a blank line always follows the bold item name paragraph.
+
+    Required structure (ALWAYS):
+        Name (bold) | [blank] | Description          (no discount)
+        Name (bold) | Discount (red) | [blank] | Description  (with discount)
+
+    If a discount line already follows the name, skip — the blank line
+    belongs after the discount, not between name and discount.
+    """
+    if not description:
+        return description
+
+    # Find end of the bold name paragraph e.g. </strong></p> or </b></p>
+    match = NAME_END_RE.search(description)
+    if not match:
+        return description
+
+    end_pos = match.end()
+
+    # Blank line already present — nothing to do
+    if _starts_with_blank_line(description, end_pos):
+        return description
+
+    # Discount line follows name directly — blank line goes after discount, not here
+    if RED_PARAGRAPH_RE.match(description, _skip_whitespace(description, end_pos)):
+        return description
+
+    return description[:end_pos] + BLANK_LINE_HTML + description[end_pos:]
+
+
+def _insert_discount_line(description, discount_percent):
+    # add_discount_to_description followed by ensure_blank_line_after_discount,
+    # on a description that no longer contains a discount line
+    insert_pos = _find_discount_position(description)
+    if insert_pos is None:
+        insert_pos = len(description)
+
+    discount_html = DISCOUNT_HTML.format(int(discount_percent))
+    if not _starts_with_blank_line(description, insert_pos):
+        discount_html += BLANK_LINE_HTML
+
+    return description[:insert_pos] + discount_html + description[insert_pos:]
+
+
+def _find_discount_position(description):
+    """Position after the first line/paragraph, or None to append at the end."""
+    # Pattern 1: Look for first </strong> or </b> tag (bold item name),
+    # then advance to the closing </p> of that paragraph for valid HTML.
+    strong_match = BOLD_CLOSE_RE.search(description)
+    if strong_match:
+        p_close = PARAGRAPH_CLOSE_RE.search(description, strong_match.end())
+        return p_close.end() if p_close else strong_match.end()
+
+    # Pattern 2: Look for first </p> tag
+    p_match = PARAGRAPH_CLOSE_RE.search(description)
+    if p_match:
+        return p_match.end()
+
+    # Pattern 3: Look for first newline
+    newline_pos = description.find('\n')
+    return newline_pos + 1 if newline_pos != -1 else None
+
+
+def _starts_with_blank_line(description, pos):
+    return bool(BLANK_LINE_RE.match(description, _skip_whitespace(description, pos)))
+
+
+def _skip_whitespace(description, pos):
+    # Same characters as .lstrip('\n\r ') in the original helpers, without copying the tail
+    while pos < len(description) and description[pos] in '\n\r ':
+        pos += 1
+    return pos
@@ -0,0 +1,127 @@
+# Copyright (c) 2026, ahmad mohammad and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from az_it.az_it.python_scripts.overrides import discount_engine
+
+
+NAME = "<p><strong>Notebook Pro 14</strong></p>"
+DISCOUNT_10 = '<p style="color: red; font-weight: bold;">inklusive 10% Rabatt</p>'
+BLANK = "<p><br></p>"
+TEXT = "<p>Intel Core i7, 16 GB RAM</p>"
+
+
+class TestDiscountEngine(FrappeTestCase):
+    def test_discount_line_goes_after_name(self):
+        self.assertEqual(
+            discount_engine.render_description(NAME + BLANK + TEXT, 10),
+            NAME + DISCOUNT_10 + BLANK + TEXT,
+        )
+
+    def test_changed_discount_replaces_line(self):
+        description = NAME + DISCOUNT_10.replace("10%", "5%") + BLANK + TEXT
+        self.assertEqual(discount_engine.render_description(description, 10), NAME + DISCOUNT_10 + BLANK + TEXT)
+
+    def test_zero_discount_removes_line(self):
+        self.assertEqual(discount_engine.render_description(NAME + DISCOUNT_10 + BLANK + TEXT, 0), NAME + BLANK + TEXT)
+
+    def test_blank_lines_are_restored(self):
+        self.assertEqual(discount_engine.render_description(NAME + TEXT, 0), NAME + BLANK + TEXT)
+        self.assertEqual(discount_engine.render_description(NAME + DISCOUNT_10 + TEXT, 10), NAME + DISCOUNT_10 + BLANK + TEXT)
+
+    def test_delivery_note_reverse_calculates_ausgangspreis(self):
+        doc = _make_doc("Delivery Note", rows=1, rate=90)
+        discount_engine.validate_custom_discount(doc)
+        self.assertAlmostEqual(doc.items[0].custom_ausgangspreis, 100)
+        self.assertAlmostEqual(doc.items[0].rate, 90)
+
+        doc = _make_doc("Quotation", rows=1, rate=90)
+        discount_engine.validate_custom_discount(doc)
+        self.assertAlmostEqual(doc.items[0].custom_ausgangspreis, 90)
+        self.assertAlmostEqual(doc.items[0].rate, 81)
+
+    def test_unchanged_rows_are_skipped(self):
+        doc = _make_doc("Quotation", rows=2, rate=81)
+        for item in doc.items:
+            item.name = f"row-{item.idx}"
+            item.custom_ausgangspreis = 90
+            item.description = NAME + TEXT
+        doc._doc_before_save = frappe.copy_doc(doc)
+        for before, item in zip(doc._doc_before_save.items, doc.items):
+            before.name = item.name
+
+        doc.items[1].custom_rabatt_in_prozent = 20
+        discount_engine.validate_custom_discount(doc)
+
+        self.assertEqual(doc.items[0].description, NAME + TEXT)
+        self.assertEqual(doc.items[1].description, NAME + DISCOUNT_10.replace("10%", "20%") + BLANK + TEXT)
+        self.assertAlmostEqual(doc.items[1].rate, 72)
+
+    def test_price_change_keeps_rendered_description(self):
+        doc = _make_doc("Quotation", rows=1, rate=81)
+        item = doc.items[0]
+        item.name = "row-1"
+        item.custom_ausgangspreis = 90
+        item.custom_rabatt_gerendert = 10
+        # Not what render_description would produce, so a rewrite would show
+        item.description = NAME + DISCOUNT_10 + TEXT
+        doc._doc_before_save = frappe.copy_doc(doc)
+        doc._doc_before_save.items[0].name = item.name
+
+        item.custom_ausgangspreis = 100
+        discount_engine.validate_custom_discount(doc)
+
+        self.assertAlmostEqual(item.rate, 90)
+        self.assertEqual(item.description, NAME + DISCOUNT_10 + TEXT)
+
+    def test_new_document_restores_discount_line(self):
+        # E.g. a duplicated quotation whose item_code was changed, which
+        # fetched the item's description without the discount line
+        doc = _make_doc("Quotation", rows=1, rate=90)
+        item = doc.items[0]
+        item.custom_ausgangspreis = 100
+        item.custom_rabatt_gerendert = 10
+
+        discount_engine.validate_custom_discount(doc)
+
+        self.assertEqual(item.description, NAME + DISCOUNT_10 + BLANK + TEXT)
+
+    def test_large_document_compiles_no_patterns(self):
+        """Micro-benchmark: a 300-row quotation validates without compiling a single regex."""
+        doc = _make_doc("Quotation", rows=300, rate=90)
+        discount_engine._render_description.cache_clear()
+
+        with patch("re._compile", side_effect=AssertionError("regex compiled during validation")):
+            discount_engine.validate_custom_discount(doc)
+            discount_engine.validate_custom_discount(doc)
+
+        self.assertEqual(doc.items[0].description, NAME + DISCOUNT_10 + BLANK + TEXT)
+
+        # One rendering per distinct description, every other row is a memo hit;
+        # the second pass renders the (unsaved) rendered descriptions again
+        cache_info = discount_engine.get_description_cache_info()
+        self.assertEqual(cache_info["misses"], 2)
+        self.assertEqual(cache_info["hits"], 598)
+
+
+def _make_doc(doctype, rows, rate):
+    # Unsaved, only the item fields the engine looks at
+    return frappe.get_doc(
+        {
+            "doctype": doctype,
+            "items": [
+                {
+                    "idx": i,
+                    "rate": rate,
+                    "custom_rabatt_in_prozent": 10,
+                    "custom_ausgangspreis": 0,
+                    "description": NAME + BLANK + TEXT,
+                }
+                for i in range(1, rows + 1)
+            ],
+        }
+    )
@@ -0,0 +1,85 @@
+// Copyright (c) 2026, ahmad mohammad and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["Call Log"] = {
+	filters: [
+		{
+			fieldname: "from_date",
+			label: __("From Date"),
+			fieldtype: "Date",
+			default: frappe.datetime.add_months(frappe.datetime.get_today(), -1),
+			on_change: reset_call_log_page,
+		},
+		{
+			fieldname: "to_date",
+			label: __("To Date"),
+			fieldtype: "Date",
+			default: frappe.datetime.get_today(),
+			on_change: reset_call_log_page,
+		},
+		{
+			fieldname: "call_type",
+			label: __("Call Type"),
+			fieldtype: "Select",
+			options: "\nInbound\nOutbound\nMissed\nNotanswered",
+			on_change: reset_call_log_page,
+		},
+		{
+			fieldname: "agent_email",
+			label: __("Agent Email"),
+			fieldtype: "Data",
+			on_change: reset_call_log_page,
+		},
+		{
+			fieldname: "group_by",
+			label: __("Group By"),
+			fieldtype: "Select",
+			options: "\nAgent\nDay\nWeek\nMonth\nCall Type\nCompany",
+			on_change: reset_call_log_page,
+		},
+		{
+			fieldname: "page_length",
+			label: __("Max Rows"),
+			fieldtype: "Int",
+			default: 500,
+			on_change: reset_call_log_page,
+		},
+		// Keyset of the last row of the previous page, set by "Next Page"
+		{
+			fieldname: "after_date",
+			fieldtype: "Data",
+			hidden: 1,
+			on_change: () => {},
+		},
+		{
+			fieldname: "after_name",
+			fieldtype: "Data",
+			hidden: 1,
+			on_change: () => {},
+		},
+	],
+
+	onload(report) {
+		report.page.add_inner_button(__("First Page"), () => reset_call_log_page(report));
+		report.page.add_inner_button(__("Next Page"), () => {
+			const page_length = cint(report.get_filter_value("page_length"));
+			const data = report.data || [];
+			if (report.get_filter_value("group_by") || !page_length || data.length < page_length) {
+				frappe.show_alert(__("No more calls"));
+				return;
+			}
+
+			const last = data[data.length - 1];
+			report.get_filter("after_date").set_value(last.communication_date);
+			report.get_filter("after_name").set_value(last.name);
+			report.refresh();
+		});
+	},
+};
+
+function reset_call_log_page(report) {
+	// Any other filter change starts again at the newest call
+	report.get_filter("after_date").set_value("");
+	report.get_filter("after_name").set_value("");
+	report.refresh();
+}
@@ -1,9 +1,64 @@
+import csv
+import io
+import os
+import tempfile
+
 import frappe
 from frappe import _
+from frappe.utils import cint, get_url, nowdate
+from werkzeug.wrappers import Response
+from werkzeug.wsgi import wrap_file
+
+
+MISSED_CALL_TYPES = ("Missed", "Notanswered")
+
+# Exports above this size are spooled to disk instead of memory
+EXPORT_SPOOL_SIZE = 5 * 1024 * 1024
+
+COMPANY_EXPRESSION = """
+    CASE
+        WHEN c.reference_doctype = 'Contact' THEN con.company_name
+        WHEN c.reference_doctype = 'Lead'    THEN lead.company_name
+        ELSE NULL
+    END
+"""
+
+COMPANY_JOINS = """
+    LEFT JOIN `tabContact` con
+        ON c.reference_doctype = 'Contact' AND c.reference_name = con.name
+    LEFT JOIN `tabLead` lead
+        ON c.reference_doctype = 'Lead' AND c.reference_name = lead.name
+"""
+
+# "Group By" filter option -> SQL grouping expression
+GROUP_BY_EXPRESSIONS = {
+    "Agent": "c.sender",
+    "Day": "DATE(c.communication_date)",
+    "Week": "DATE_SUB(DATE(c.communication_date), INTERVAL WEEKDAY(c.communication_date) DAY)",
+    "Month": "DATE_FORMAT(c.communication_date, '%%Y-%%m-01')",
+    "Call Type": "c.custom_call_type",
+    "Company": COMPANY_EXPRESSION,
+}
+
+# Groupings answered from the pre-aggregated Call Statistics rollup
+ROLLUP_GROUP_BY_EXPRESSIONS = {
+    "Agent": "s.agent",
+    "Day": "s.call_date",
+    "Week": "DATE_SUB(s.call_date, INTERVAL WEEKDAY(s.call_date) DAY)",
+    "Month": "DATE_FORMAT(s.call_date, '%%Y-%%m-01')",
+    "Call Type": "s.call_type",
+}
+
+TIME_GROUPS = ("Day", "Week", "Month")
 
 
 def execute(filters=None):
     filters = filters or {}
+
+    if filters.get("group_by"):
+        data = get_grouped_data(filters)
+        return get_grouped_columns(filters), data, None, get_chart(filters, data)
+
     return get_columns(), get_data(filters)
 
 
@@ -21,7 +76,7 @@ def get_columns():
     ]
 
 
-def get_data(filters):
+def get_conditions(filters):
     conditions = ["c.communication_medium = 'Phone'"]
     values = {}
 
@@ -41,11 +96,46 @@ def get_data(filters):
         conditions.append("c.sender = %(agent_email)s")
         values["agent_email"] = filters["agent_email"]
 
-    where = " AND ".join(conditions)
+    return " AND ".join(conditions), values
 
-    rows = frappe.db.sql(
-        f"""
+
+def get_data(filters):
+    """
+    Call rows, newest first.
+
+    With a page_length the rows are paginated by keyset on
+    (communication_date, name): pass the last row's values as after_date and
+    after_name to fetch the next page. Served by call_log_index (see
+    az_it.az_it.setup.indexes).
+    """
+    where, values = get_conditions(filters)
+
+    limit = ""
+    page_length = cint(filters.get("page_length"))
+    if page_length:
+        if filters.get("after_date") and filters.get("after_name"):
+            where += """
+                AND (
+                    c.communication_date < %(after_date)s
+                    OR (c.communication_date = %(after_date)s AND c.name < %(after_name)s)
+                )
+            """
+            values["after_date"] = filters["after_date"]
+            values["after_name"] = filters["after_name"]
+        limit = f"LIMIT {page_length}"
+
+    rows = frappe.db.sql(get_rows_query(where, limit), values, as_dict=True)
+
+    for row in rows:
+        row["duration_display"] = format_duration(row.get("custom_duration_seconds"))
+
+    return rows
+
+
+def get_rows_query(where, limit=""):
+    return f"""
         SELECT
+            c.name,
             c.communication_date,
             c.custom_call_type,
             c.phone_no,
@@ -53,54 +143,248 @@ def get_data(filters):
             c.reference_doctype,
             c.sender,
             c.custom_duration_seconds,
-            CASE
-                WHEN c.reference_doctype = 'Contact' THEN con.company_name
-                WHEN c.reference_doctype = 'Lead'    THEN lead.company_name
-                ELSE NULL
-            END AS company_name
+            {COMPANY_EXPRESSION} AS company_name
         FROM `tabCommunication` c
-        LEFT JOIN `tabContact` con
-            ON c.reference_doctype = 'Contact' AND c.reference_name = con.name
-        LEFT JOIN `tabLead` lead
-            ON c.reference_doctype = 'Lead' AND c.reference_name = lead.name
+        {COMPANY_JOINS}
         WHERE {where}
-        ORDER BY c.communication_date DESC
+        ORDER BY c.communication_date DESC, c.name DESC
+        {limit}
+    """
+
+
+def iter_rows(filters):
+    """Yields call rows from an unbuffered server-side cursor, so memory stays constant."""
+    where, values = get_conditions(filters)
+
+    with frappe.db.unbuffered_cursor():
+        for row in frappe.db.sql(get_rows_query(where), values, as_dict=True, as_iterator=True):
+            row["duration_display"] = format_duration(row.get("custom_duration_seconds"))
+            yield row
+
+
+def get_grouped_columns(filters):
+    group_by = filters["group_by"]
+    return [
+        {
+            "label": _(group_by),
+            "fieldname": "group_key",
+            "fieldtype": "Date" if group_by in TIME_GROUPS else "Data",
+            "width": 180,
+        },
+        {"label": _("Calls"), "fieldname": "call_count", "fieldtype": "Int", "width": 90},
+        {"label": _("Missed"), "fieldname": "missed_count", "fieldtype": "Int", "width": 90},
+        {"label": _("Missed %"), "fieldname": "missed_ratio", "fieldtype": "Percent", "width": 90},
+        {"label": _("Total Duration"), "fieldname": "total_duration_display", "fieldtype": "Data", "width": 110},
+        {"label": _("Avg Duration"), "fieldname": "avg_duration_display", "fieldtype": "Data", "width": 110},
+        {"label": _("Max Duration"), "fieldname": "max_duration_display", "fieldtype": "Data", "width": 110},
+        {"label": _("Total (s)"), "fieldname": "total_duration_seconds", "fieldtype": "Int", "width": 100},
+    ]
+
+
+def get_grouped_data(filters):
+    """
+    Aggregates calls in SQL; only one row per group reaches Python.
+    Everything but company grouping is read from the Call Statistics rollup.
+    """
+    group_by = filters["group_by"]
+    if group_by not in GROUP_BY_EXPRESSIONS:
+        frappe.throw(_("Invalid Group By: {0}").format(group_by))
+
+    if group_by in ROLLUP_GROUP_BY_EXPRESSIONS:
+        rows = get_rollup_data(filters)
+    else:
+        rows = get_communication_aggregates(filters)
+
+    for row in rows:
+        for key in ("total", "avg", "max"):
+            row[f"{key}_duration_display"] = format_duration(row.get(f"{key}_duration_seconds"))
+
+    return rows
+
+
+def get_rollup_data(filters):
+    group_by = filters["group_by"]
+    conditions = ["1 = 1"]
+    values = {"missed_call_types": MISSED_CALL_TYPES}
+
+    if filters.get("from_date"):
+        conditions.append("s.call_date >= %(from_date)s")
+        values["from_date"] = filters["from_date"]
+
+    if filters.get("to_date"):
+        conditions.append("s.call_date <= %(to_date)s")
+        values["to_date"] = filters["to_date"]
+
+    if filters.get("call_type"):
+        conditions.append("s.call_type = %(call_type)s")
+        values["call_type"] = filters["call_type"]
+
+    if filters.get("agent_email"):
+        conditions.append("s.agent = %(agent_email)s")
+        values["agent_email"] = filters["agent_email"]
+
+    return frappe.db.sql(
+        f"""
+        SELECT
+            {ROLLUP_GROUP_BY_EXPRESSIONS[group_by]} AS group_key,
+            SUM(s.call_count) AS call_count,
+            SUM(IF(s.call_type IN %(missed_call_types)s, s.call_count, 0)) AS missed_count,
+            ROUND(100 * SUM(IF(s.call_type IN %(missed_call_types)s, s.call_count, 0)) / SUM(s.call_count), 1)
+                AS missed_ratio,
+            SUM(s.total_duration_seconds) AS total_duration_seconds,
+            SUM(s.total_duration_seconds) / SUM(s.call_count) AS avg_duration_seconds,
+            MAX(s.max_duration_seconds) AS max_duration_seconds
+        FROM `tabCall Statistics` s
+        WHERE {" AND ".join(conditions)}
+        GROUP BY group_key
+        ORDER BY {get_group_order_by(group_by)}
         """,
         values,
         as_dict=True,
     )
 
-    for row in rows:
-        secs = row.get("custom_duration_seconds") or 0
-        m, s = divmod(int(secs), 60)
-        row["duration_display"] = f"{m}m {s}s" if m else f"{s}s"
 
-    return rows
+def get_communication_aggregates(filters):
+    group_by = filters["group_by"]
+    where, values = get_conditions(filters)
+    values["missed_call_types"] = MISSED_CALL_TYPES
+
+    return frappe.db.sql(
+        f"""
+        SELECT
+            {GROUP_BY_EXPRESSIONS[group_by]} AS group_key,
+            COUNT(*) AS call_count,
+            SUM(c.custom_call_type IN %(missed_call_types)s) AS missed_count,
+            ROUND(100 * SUM(c.custom_call_type IN %(missed_call_types)s) / COUNT(*), 1) AS missed_ratio,
+            SUM(IFNULL(c.custom_duration_seconds, 0)) AS total_duration_seconds,
+            AVG(IFNULL(c.custom_duration_seconds, 0)) AS avg_duration_seconds,
+            MAX(IFNULL(c.custom_duration_seconds, 0)) AS max_duration_seconds
+        FROM `tabCommunication` c
+        {COMPANY_JOINS if group_by == "Company" else ""}
+        WHERE {where}
+        GROUP BY group_key
+        ORDER BY {get_group_order_by(group_by)}
+        """,
+        values,
+        as_dict=True,
+    )
 
 
-def get_filters():
-    return [
-        {
-            "fieldname": "from_date",
-            "label": _("From Date"),
-            "fieldtype": "Date",
-            "default": frappe.utils.add_months(frappe.utils.today(), -1),
-        },
-        {
-            "fieldname": "to_date",
-            "label": _("To Date"),
-            "fieldtype": "Date",
-            "default": frappe.utils.today(),
+def get_group_order_by(group_by):
+    return "group_key" if group_by in TIME_GROUPS else "call_count DESC"
+
+
+def get_chart(filters, data):
+    return {
+        "data": {
+            "labels": [str(row.group_key or _("Not Set")) for row in data],
+            "datasets": [
+                {"name": _("Calls"), "values": [row.call_count for row in data]},
+                {"name": _("Missed"), "values": [int(row.missed_count or 0) for row in data]},
+            ],
         },
+        "type": "line" if filters["group_by"] in TIME_GROUPS else "bar",
+    }
+
+
+def format_duration(secs):
+    m, s = divmod(int(secs or 0), 60)
+    return f"{m}m {s}s" if m else f"{s}s"
+
+
+@frappe.whitelist()
+def export(filters=None, file_format="CSV", background=0):
+    """
+    Exports the Call Log rows without building the result in memory.
+
+    CSV is written row by row from a server-side cursor into a spooled temp
+    file and streamed back in chunks. Excel exports (or background=1) are
+    generated by a background job into a private File; the user is notified
+    with its link when done.
+    """
+    frappe.has_permission("Communication", "report", throw=True)
+    filters = frappe.parse_json(filters) or {}
+
+    if file_format not in ("CSV", "Excel"):
+        frappe.throw(_("Unsupported export format: {0}").format(file_format))
+
+    if file_format == "Excel" or cint(background):
+        frappe.enqueue(
+            "az_it.az_it.report.call_log.call_log.build_export_file",
+            queue="long",
+            timeout=60 * 60,
+            filters=filters,
+            file_format=file_format,
+        )
+        return {"queued": 1}
+
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+    text = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+    write_csv(filters, text)
+    text.flush()
+    text.detach()
+    spool.seek(0)
+
+    response = Response(
+        wrap_file(frappe.local.request.environ, spool),
+        mimetype="text/csv",
+        direct_passthrough=True,
+    )
+    response.headers["Content-Disposition"] = f'attachment; filename="call-log-{nowdate()}.csv"'
+    return response
+
+
+def build_export_file(filters, file_format="CSV"):
+    """Background job: writes the export straight into a private File and notifies the user."""
+    extension = "xlsx" if file_format == "Excel" else "csv"
+    file_name = f"call-log-{nowdate()}-{frappe.generate_hash(length=6)}.{extension}"
+    path = frappe.get_site_path("private", "files", file_name)
+
+    if file_format == "Excel":
+        write_xlsx(filters, path)
+    else:
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            write_csv(filters, f)
+
+    file_doc = frappe.get_doc(
         {
-            "fieldname": "call_type",
-            "label": _("Call Type"),
-            "fieldtype": "Select",
-            "options": "\nInbound\nOutbound\nMissed\nNotanswered",
-        },
+            "doctype": "File",
+            "file_name": file_name,
+            "file_url": f"/private/files/{file_name}",
+            "is_private": 1,
+            "file_size": os.path.getsize(path),
+        }
+    ).insert(ignore_permissions=True)
+    frappe.db.commit()
+
+    frappe.publish_realtime(
+        "msgprint",
         {
-            "fieldname": "agent_email",
-            "label": _("Agent Email"),
-            "fieldtype": "Data",
+            "title": _("Call Log Export"),
+            "message": _("Your export is ready: {0}").format(
+                f'<a href="{get_url(file_doc.file_url)}">{file_name}</a>'
+            ),
         },
-    ]
+        user=frappe.session.user,
+    )
+
+
+def write_csv(filters, f):
+    columns = get_columns()
+    writer = csv.writer(f)
+    writer.writerow([column["label"] for column in columns])
+    for row in iter_rows(filters):
+        writer.writerow([row.get(column["fieldname"]) for column in columns])
+
+
+def write_xlsx(filters, path):
+    from openpyxl import Workbook
+
+    # write_only streams rows to disk instead of keeping the sheet in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(_("Call Log"))
+    columns = get_columns()
+    sheet.append([column["label"] for column in columns])
+    for row in iter_rows(filters):
+        sheet.append([row.get(column["fieldname"]) for column in columns])
+    workbook.save(path)
@@ -0,0 +1,25 @@
+// Copyright (c) 2026, ahmad mohammad and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["Dunning Automation Runs"] = {
+	filters: [
+		{
+			fieldname: "from_date",
+			label: __("From Date"),
+			fieldtype: "Date",
+			default: frappe.datetime.add_months(frappe.datetime.get_today(), -3),
+		},
+		{
+			fieldname: "to_date",
+			label: __("To Date"),
+			fieldtype: "Date",
+			default: frappe.datetime.get_today(),
+		},
+		{
+			fieldname: "status",
+			label: __("Status"),
+			fieldtype: "Select",
+			options: "\nRunning\nCompleted\nFailed",
+		},
+	],
+};
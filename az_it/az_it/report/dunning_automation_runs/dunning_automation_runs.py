@@ -0,0 +1,66 @@
+import frappe
+from frappe import _
+from frappe.utils import add_days
+
+
+def execute(filters=None):
+    filters = filters or {}
+    data = get_data(filters)
+    return get_columns(), data, None, get_chart(data)
+
+
+def get_columns():
+    return [
+        {"label": _("Run"), "fieldname": "name", "fieldtype": "Link", "options": "Dunning Automation Run", "width": 110},
+        {"label": _("Started"), "fieldname": "started", "fieldtype": "Datetime", "width": 160},
+        {"label": _("Status"), "fieldname": "status", "fieldtype": "Data", "width": 90},
+        {"label": _("Wall Time (s)"), "fieldname": "wall_time_seconds", "fieldtype": "Float", "width": 100},
+        {"label": _("Queries"), "fieldname": "total_queries", "fieldtype": "Int", "width": 80},
+        {"label": _("Invoices Scanned"), "fieldname": "invoices_scanned", "fieldtype": "Int", "width": 120},
+        {"label": _("Planned"), "fieldname": "dunnings_planned", "fieldtype": "Int", "width": 80},
+        {"label": _("Level 1"), "fieldname": "level_1_drafts", "fieldtype": "Int", "width": 70},
+        {"label": _("Level 2"), "fieldname": "level_2_drafts", "fieldtype": "Int", "width": 70},
+        {"label": _("Level 3"), "fieldname": "level_3_drafts", "fieldtype": "Int", "width": 70},
+        {"label": _("Errors"), "fieldname": "errors", "fieldtype": "Int", "width": 70},
+        {"label": _("Failed Chunks"), "fieldname": "failed_chunks", "fieldtype": "Int", "width": 100},
+        {"label": _("Not Due"), "fieldname": "skipped_not_due", "fieldtype": "Int", "width": 80},
+        {"label": _("Waiting"), "fieldname": "skipped_waiting", "fieldtype": "Int", "width": 80},
+        {"label": _("Nothing Overdue"), "fieldname": "skipped_nothing_overdue", "fieldtype": "Int", "width": 110},
+        {"label": _("Seconds per Invoice"), "fieldname": "seconds_per_invoice", "fieldtype": "Float", "precision": 4, "width": 130},
+    ]
+
+
+def get_data(filters):
+    run_filters = []
+    if filters.get("from_date"):
+        run_filters.append(["started", ">=", filters["from_date"]])
+    if filters.get("to_date"):
+        run_filters.append(["started", "<", add_days(filters["to_date"], 1)])
+    if filters.get("status"):
+        run_filters.append(["status", "=", filters["status"]])
+
+    data = frappe.get_all(
+        "Dunning Automation Run",
+        filters=run_filters,
+        fields=[column["fieldname"] for column in get_columns() if column["fieldname"] != "seconds_per_invoice"],
+        order_by="started",
+    )
+    for row in data:
+        row.seconds_per_invoice = row.wall_time_seconds / row.invoices_scanned if row.invoices_scanned else 0
+
+    return data
+
+
+def get_chart(data):
+    return {
+        "data": {
+            "labels": [str(row.started)[:10] for row in data],
+            "datasets": [
+                {"name": _("Invoices Scanned"), "values": [row.invoices_scanned for row in data]},
+                {"name": _("Drafts"), "values": [row.level_1_drafts + row.level_2_drafts + row.level_3_drafts for row in data]},
+                {"name": _("Wall Time (s)"), "values": [row.wall_time_seconds for row in data]},
+            ],
+        },
+        "type": "line",
+    }
+
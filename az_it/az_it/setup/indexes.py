@@ -0,0 +1,53 @@
+"""
+Indexes that the reports and the dunning automation rely on.
+
+Created from the after_install / after_migrate hooks (see az_it.install) as
+well as from their patches, since install_app marks patches as done without
+running them. Every helper is idempotent.
+"""
+
+import frappe
+
+
+def ensure_indexes():
+    ensure_call_log_index()
+    ensure_dunning_indexes()
+
+
+def ensure_call_log_index():
+    """
+    Composite index for the Call Log report on tabCommunication.
+
+    tabCommunication also holds every email, so the report's filter on
+    communication_medium/communication_date/custom_call_type/sender and its
+    ORDER BY communication_date DESC, name DESC would otherwise scan and sort
+    the table. name follows communication_date so that the index returns rows
+    in keyset order; call type and agent are checked in the index as residual
+    filters.
+    """
+    # custom_call_type comes from az_it/custom
+    if not frappe.db.has_column("Communication", "custom_call_type"):
+        return
+
+    frappe.db.add_index(
+        "Communication",
+        ["communication_medium", "communication_date", "name", "custom_call_type", "sender"],
+        index_name="call_log_index",
+    )
+
+
+def ensure_dunning_indexes():
+    """
+    Indexes for the dunning history lookup of the dunning automation.
+
+    _get_dunning_history joins Overdue Payment → Dunning → Dunning Type for
+    batches of invoices. Overdue Payment has no index on sales_invoice, so every
+    batch scanned the whole child table; (sales_invoice, parent) makes the lookup
+    index-only, and Dunning / Dunning Type are then joined by primary key.
+    """
+    frappe.db.add_index("Overdue Payment", ["sales_invoice", "parent"], index_name="sales_invoice_parent_index")
+
+    # custom_dunning_level comes from the fixtures; its search_index also
+    # creates this index once they are synced
+    if frappe.db.has_column("Dunning Type", "custom_dunning_level"):
+        frappe.db.add_index("Dunning Type", ["custom_dunning_level"])
@@ -0,0 +1,194 @@
+# Copyright (c) 2026, ahmad mohammad and Contributors
+# See license.txt
+
+from unittest.mock import MagicMock, patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import getdate
+
+from az_it.az_it import dunning_automation
+from az_it.az_it.setup.indexes import ensure_dunning_indexes
+
+
+class TestDunningHistoryIndexes(FrappeTestCase):
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		# Independent of whether the site ran the index patch
+		ensure_dunning_indexes()
+
+	def setUp(self):
+		# Enough history rows that the optimizer does not fall back to table scans
+		frappe.db.bulk_insert(
+			"Dunning Type",
+			["name", "custom_dunning_level"],
+			[(f"_Test Dunning Level {level}", level) for level in (1, 2, 3)],
+		)
+		frappe.db.bulk_insert(
+			"Dunning",
+			["name", "dunning_type", "docstatus", "posting_date"],
+			[(f"_T-DUNN-{i:04d}", f"_Test Dunning Level {i % 3 + 1}", i % 2, "2026-01-01") for i in range(200)],
+		)
+		frappe.db.bulk_insert(
+			"Overdue Payment",
+			["name", "parent", "parenttype", "parentfield", "sales_invoice"],
+			[
+				(f"_T-OP-{i:04d}", f"_T-DUNN-{i:04d}", "Dunning", "overdue_payments", f"_T-SINV-{i // 2:04d}")
+				for i in range(200)
+			],
+		)
+
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def test_history_lookup_is_index_only(self):
+		query = dunning_automation._get_dunning_history_query(["_T-SINV-0001", "_T-SINV-0042"])
+		plan = {row.table: row for row in frappe.db.sql(f"EXPLAIN {query.get_sql()}", as_dict=True)}
+
+		overdue_payment = plan["tabOverdue Payment"]
+		self.assertEqual(overdue_payment.key, "sales_invoice_parent_index")
+		self.assertIn("Using index", overdue_payment.Extra or "")
+
+		# Dunning is joined by primary key
+		self.assertEqual(plan["tabDunning"].key, "PRIMARY")
+
+	def test_history_lookup_result(self):
+		history = dunning_automation._get_dunning_history(["_T-SINV-0001"])
+
+		# _T-SINV-0001 has _T-DUNN-0002 (level 3, draft) and _T-DUNN-0003 (level 1, submitted)
+		self.assertEqual(set(history["_T-SINV-0001"]), {1, 3})
+		self.assertIsNone(history["_T-SINV-0001"][3].submitted_posting_date)
+		self.assertEqual(str(history["_T-SINV-0001"][1].submitted_posting_date), "2026-01-01")
+
+
+LEVELS = {
+	1: frappe._dict(name="Mahnung 1", custom_dunning_level=1, custom_days_trigger=14),
+	2: frappe._dict(name="Mahnung 2", custom_dunning_level=2, custom_days_trigger=20),
+	# No trigger days set, so the default of 10 days applies
+	3: frappe._dict(name="Mahnung 3", custom_dunning_level=3, custom_days_trigger=None),
+}
+
+
+class TestNextDunning(FrappeTestCase):
+	def test_next_level(self):
+		# (history: {level: submitted posting date or None for a draft}, expected type, expected trigger date)
+		cases = [
+			({}, "Mahnung 1", "2026-02-14"),
+			({1: None}, None, None),
+			({1: "2026-03-01"}, "Mahnung 2", "2026-03-21"),
+			({1: "2026-03-01", 2: None}, None, None),
+			({1: "2026-03-01", 2: "2026-04-01"}, "Mahnung 3", "2026-04-11"),
+			({1: "2026-03-01", 2: "2026-04-01", 3: None}, None, None),
+			# Level 3 only depends on the submitted level 2
+			({1: None, 2: "2026-04-01"}, "Mahnung 3", "2026-04-11"),
+		]
+		invoice = frappe._dict(name="_T-SINV-0001", due_date="2026-01-31")
+
+		for history, dunning_type, trigger_date in cases:
+			with self.subTest(history=history):
+				config, date = dunning_automation._get_next_dunning(invoice, LEVELS, _history(history))
+				self.assertEqual(config.name if config else None, dunning_type)
+				self.assertEqual(date, getdate(trigger_date) if trigger_date else None)
+
+	def test_invoice_without_due_date_is_skipped(self):
+		invoice = frappe._dict(name="_T-SINV-0001", due_date=None)
+		self.assertEqual(dunning_automation._get_next_dunning(invoice, LEVELS, {}), (None, None))
+
+	def test_latest_submitted_dunning_wins(self):
+		rows = [
+			frappe._dict(sales_invoice="_T-SINV-0001", custom_dunning_level=1, docstatus=1, posting_date="2026-03-15"),
+			frappe._dict(sales_invoice="_T-SINV-0001", custom_dunning_level=1, docstatus=1, posting_date="2026-03-01"),
+			# Drafts mark the level as taken but never move its posting date
+			frappe._dict(sales_invoice="_T-SINV-0001", custom_dunning_level=1, docstatus=0, posting_date="2026-04-01"),
+			frappe._dict(sales_invoice="_T-SINV-0001", custom_dunning_level=2, docstatus=0, posting_date="2026-04-01"),
+		]
+		query = MagicMock()
+		query.run.return_value = rows
+
+		with patch.object(dunning_automation, "_get_dunning_history_query", return_value=query):
+			history = dunning_automation._get_dunning_history(["_T-SINV-0001"])
+
+		self.assertEqual(history["_T-SINV-0001"][1].submitted_posting_date, getdate("2026-03-15"))
+		self.assertIsNone(history["_T-SINV-0001"][2].submitted_posting_date)
+
+
+class TestCompanyDunningTypes(FrappeTestCase):
+	def test_company_type_overrides_default(self):
+		default_1 = frappe._dict(name="Mahnung 1", custom_dunning_level=1, company=None)
+		default_2 = frappe._dict(name="Mahnung 2", custom_dunning_level=2, company=None)
+		company_1 = frappe._dict(name="Mahnung 1 AZ", custom_dunning_level=1, company="_Test AZ")
+
+		# The result must not depend on the order get_all returns the types in
+		for dunning_types in ([default_1, default_2, company_1], [company_1, default_2, default_1]):
+			with self.subTest(order=[dt.name for dt in dunning_types]):
+				with patch("frappe.get_all", return_value=dunning_types):
+					by_company = dunning_automation._get_dunning_types_by_company()
+
+				self.assertEqual(by_company["_Test AZ"][1].name, "Mahnung 1 AZ")
+				self.assertEqual(by_company["_Test AZ"][2].name, "Mahnung 2")
+				self.assertEqual(by_company[None][1].name, "Mahnung 1")
+
+
+class TestPartitionPlan(FrappeTestCase):
+	def setUp(self):
+		# (invoice, company, customer, currency, level)
+		self.plan = _plan(
+			[
+				("_T-SINV-0001", "_Test AZ", "_Test Kunde 1", "EUR", 1),
+				("_T-SINV-0002", "_Test AZ", "_Test Kunde 1", "EUR", 1),
+				("_T-SINV-0003", "_Test AZ", "_Test Kunde 1", "EUR", 1),
+				("_T-SINV-0004", "_Test AZ", "_Test Kunde 1", "USD", 1),
+				("_T-SINV-0005", "_Test AZ", "_Test Kunde 1", "EUR", 2),
+				("_T-SINV-0006", "_Test AZ", "_Test Kunde 2", "EUR", 1),
+				("_T-SINV-0007", "_Test Other", "_Test Kunde 1", "EUR", 1),
+				("_T-SINV-0008", "_Test Other", "_Test Kunde 2", "EUR", 1),
+			]
+		)
+		self.company = {entry.invoice.name: entry.invoice.company for entry in self.plan}
+
+	def test_chunks_never_mix_companies(self):
+		for consolidate in (False, True):
+			with self.subTest(consolidate=consolidate), patch.object(dunning_automation, "DRAFT_CHUNK_SIZE", 2):
+				chunks = dunning_automation._partition_plan(self.plan, consolidate=consolidate)
+
+				invoices = []
+				for chunk in chunks:
+					names = [name for entry_names, _type, _level in chunk for name in entry_names]
+					self.assertEqual(len({self.company[name] for name in names}), 1)
+					invoices.extend(names)
+				self.assertEqual(sorted(invoices), sorted(self.company))
+
+	def test_one_entry_per_invoice_without_consolidation(self):
+		entries = [entry for chunk in dunning_automation._partition_plan(self.plan) for entry in chunk]
+		self.assertEqual(len(entries), len(self.plan))
+		self.assertTrue(all(len(names) == 1 for names, _type, _level in entries))
+
+	def test_consolidated_group_stays_in_one_entry(self):
+		# Smaller than the group, which must still not be split across chunks
+		with patch.object(dunning_automation, "DRAFT_CHUNK_SIZE", 2):
+			chunks = dunning_automation._partition_plan(self.plan, consolidate=True)
+
+		entries = {tuple(names): (dunning_type, level) for chunk in chunks for names, dunning_type, level in chunk}
+		self.assertEqual(entries[("_T-SINV-0001", "_T-SINV-0002", "_T-SINV-0003")], ("Mahnung 1", 1))
+		# Another currency or level is another Dunning
+		self.assertEqual(entries[("_T-SINV-0004",)], ("Mahnung 1", 1))
+		self.assertEqual(entries[("_T-SINV-0005",)], ("Mahnung 2", 2))
+		self.assertEqual(len(entries), 6)
+
+
+def _plan(invoices):
+	return [
+		frappe._dict(
+			invoice=frappe._dict(name=name, company=company, customer=customer, currency=currency),
+			dunning_type=LEVELS[level],
+		)
+		for name, company, customer, currency, level in invoices
+	]
+
+
+def _history(levels):
+	return {
+		level: frappe._dict(submitted_posting_date=getdate(posting_date) if posting_date else None)
+		for level, posting_date in levels.items()
+	}
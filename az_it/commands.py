@@ -0,0 +1,72 @@
+import json
+
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("import-3cx-cdr")
+@click.argument("csv_path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--start-row", default=0, type=int, help="Skip this many data rows, e.g. to resume an interrupted import")
+@click.option("--agent-map", type=click.Path(exists=True, dir_okay=False), help="JSON file mapping extension numbers to agent emails")
+@pass_context
+def import_3cx_cdr(context, csv_path, start_row=0, agent_map=None):
+	"""Import call history from a 3CX CDR CSV export as Communications."""
+	import frappe
+
+	from az_it.az_it.api.cdr_import import import_cdr_file
+
+	def progress(summary):
+		click.echo(
+			f"Row {summary.last_row}: {summary.inserted} inserted, "
+			f"{summary.duplicates} already imported, {summary.skipped} skipped"
+		)
+
+	if agent_map:
+		with open(agent_map) as f:
+			agent_map = json.load(f)
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		summary = import_cdr_file(csv_path, start_row=start_row, agent_map=agent_map, progress=progress)
+	finally:
+		frappe.destroy()
+
+	click.echo(f"Done. Resume with --start-row {summary.last_row} if more rows are appended later.")
+
+
+@click.command("plan-dunnings")
+@click.option("--json", "as_json", is_flag=True, default=False, help="Print the full plan as JSON")
+@pass_context
+def plan_dunnings(context, as_json=False):
+	"""Dry-run the daily dunning automation: show which drafts would be created, without creating them."""
+	import frappe
+
+	from az_it.az_it.dunning_automation import get_dunning_plan
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		frappe.set_user("Administrator")
+		result = get_dunning_plan()
+	finally:
+		frappe.destroy()
+
+	if as_json:
+		click.echo(json.dumps(result, indent=1, default=str))
+		return
+
+	for entry in result["plan"]:
+		click.echo(
+			f"{entry['invoice']}: level {entry['level']} ({entry['dunning_type']}), "
+			f"due since {entry['trigger_date']}"
+		)
+	for name, phase in result["phases"].items():
+		click.echo(f"{name}: {phase['seconds']}s, {phase['queries']} queries")
+	click.echo(
+		f"{len(result['plan'])} of {result['invoices_scanned']} overdue invoices would be dunned "
+		f"({result['total_seconds']}s, {result['total_queries']} queries)."
+	)
+
+
+commands = [import_3cx_cdr, plan_dunnings]
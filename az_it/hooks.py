@@ -81,16 +81,18 @@ doctype_js = {
 # ----------
 
 # add methods and filters to jinja environment
-# jinja = {
-# 	"methods": "az_it.utils.jinja_methods",
-# 	"filters": "az_it.utils.jinja_filters"
-# }
+jinja = {
+    "methods": [
+        "az_it.az_it.python_scripts.overrides.discount_engine.discount_line"
+    ]
+}
 
 # Installation
 # ------------
 
 # before_install = "az_it.install.before_install"
-# after_install = "az_it.install.after_install"
+after_install = "az_it.install.after_install"
+after_migrate = "az_it.install.after_migrate"
 
 # Uninstallation
 # ------------
@@ -148,29 +150,52 @@ doc_events = {
     "Communication": {
         "validate": "az_it.az_it.python_scripts.overrides.sales_invoice_email.set_invoice_email_sender"
     },
+    "Contact": {
+        "validate": "az_it.az_it.api.telephony.set_contact_phone_keys",
+        "on_update": "az_it.az_it.api.telephony.invalidate_contact_lookup_cache",
+        "on_trash": "az_it.az_it.api.telephony.invalidate_contact_lookup_cache"
+    },
+    "Lead": {
+        "validate": "az_it.az_it.api.telephony.set_lead_phone_keys",
+        "on_update": "az_it.az_it.api.telephony.invalidate_lead_lookup_cache",
+        "on_trash": "az_it.az_it.api.telephony.invalidate_lead_lookup_cache"
+    },
     "Item": {
         "validate": "az_it.az_it.python_scripts.overrides.item_description.prepend_item_name_to_description"
     },
     "Sales Order": {
         "validate": [
             "az_it.az_it.python_scripts.overrides.sales_order.validate_preisanpassung",
-            "az_it.az_it.python_scripts.overrides.sales_order_discount.validate_custom_discount"
+            "az_it.az_it.python_scripts.overrides.discount_engine.validate_custom_discount"
         ]
     },
     "Quotation": {
         "validate": [
             "az_it.az_it.python_scripts.overrides.quotation.validate_preisanpassung",
-            "az_it.az_it.python_scripts.overrides.quotation_discount.validate_custom_discount"
+            "az_it.az_it.python_scripts.overrides.discount_engine.validate_custom_discount"
         ]
     },
     "Sales Invoice": {
         "validate": [
-            "az_it.az_it.python_scripts.overrides.sales_invoice_discount.validate_custom_discount",
+            "az_it.az_it.python_scripts.overrides.discount_engine.validate_custom_discount",
             "az_it.az_it.python_scripts.overrides.sales_invoice_auftrag.auto_fill_auftrag_from_items"
-        ]
+        ],
+        "on_submit": "az_it.az_it.dunning_automation.set_next_dunning_check"
+    },
+    "Payment Entry": {
+        "on_submit": "az_it.az_it.dunning_automation.reset_next_dunning_check_for_payment",
+        "on_cancel": "az_it.az_it.dunning_automation.reset_next_dunning_check_for_payment"
+    },
+    "Dunning": {
+        "on_submit": "az_it.az_it.dunning_automation.reset_next_dunning_check_for_dunning",
+        "on_cancel": "az_it.az_it.dunning_automation.reset_next_dunning_check_for_dunning",
+        "on_trash": "az_it.az_it.dunning_automation.reset_next_dunning_check_for_dunning"
+    },
+    "Dunning Type": {
+        "on_update": "az_it.az_it.dunning_automation.reset_all_next_dunning_checks"
     },
     "Delivery Note": {
-        "validate": "az_it.az_it.python_scripts.overrides.delivery_note_discount.validate_custom_discount"
+        "validate": "az_it.az_it.python_scripts.overrides.discount_engine.validate_custom_discount"
     }
 }
 
@@ -178,8 +203,12 @@ doc_events = {
 # ---------------
 
 scheduler_events = {
+	"all": [
+		"az_it.az_it.api.telephony.schedule_call_queue_drain",
+	],
 	"daily": [
 		"az_it.az_it.dunning_automation.auto_create_dunnings",
+		"az_it.az_it.doctype.call_statistics.call_statistics.reconcile_call_statistics",
 	],
 }
 
@@ -0,0 +1,9 @@
+from az_it.az_it.setup.indexes import ensure_indexes
+
+
+def after_install():
+    ensure_indexes()
+
+
+def after_migrate():
+    ensure_indexes()
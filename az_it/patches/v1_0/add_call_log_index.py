@@ -0,0 +1,17 @@
+"""
+Patch: Composite index for the Call Log report on tabCommunication
+(see az_it.az_it.setup.indexes.ensure_call_log_index).
+"""
+
+import frappe
+from frappe.modules.utils import sync_customizations
+
+from az_it.az_it.setup.indexes import ensure_call_log_index
+
+
+def execute():
+    # custom_call_type comes from az_it/custom, which is synced after post_model_sync patches
+    if not frappe.db.has_column("Communication", "custom_call_type"):
+        sync_customizations("az_it")
+
+    ensure_call_log_index()
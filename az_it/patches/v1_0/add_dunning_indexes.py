@@ -0,0 +1,10 @@
+"""
+Patch: Indexes for the dunning history lookup of the dunning automation
+(see az_it.az_it.setup.indexes.ensure_dunning_indexes).
+"""
+
+from az_it.az_it.setup.indexes import ensure_dunning_indexes
+
+
+def execute():
+    ensure_dunning_indexes()
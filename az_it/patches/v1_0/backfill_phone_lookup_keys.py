@@ -0,0 +1,34 @@
+"""
+Patch: Fill the normalized phone lookup keys used by the 3CX caller lookup.
+
+Contact Phone and Lead carry indexed custom_*_key columns holding the last
+9 digits of each number (see az_it.az_it.api.telephony._normalize). New and
+edited records get them from validate hooks; this fills existing rows once.
+"""
+
+import frappe
+from frappe.modules.utils import sync_customizations
+
+
+KEY_COLUMNS = [
+    ("tabContact Phone", "phone", "custom_phone_key"),
+    ("tabLead", "phone", "custom_phone_key"),
+    ("tabLead", "mobile_no", "custom_mobile_no_key"),
+    ("tabLead", "whatsapp_no", "custom_whatsapp_no_key"),
+]
+
+
+def execute():
+    # Customizations from az_it/custom are synced after post_model_sync
+    # patches, so make sure the key columns exist before filling them.
+    sync_customizations("az_it")
+
+    for table, source_field, key_field in KEY_COLUMNS:
+        frappe.db.sql(
+            f"""
+            UPDATE `{table}`
+            SET `{key_field}` = RIGHT(REGEXP_REPLACE(IFNULL(`{source_field}`, ''), '[^0-9]', ''), 9)
+            """
+        )
+
+    frappe.db.commit()
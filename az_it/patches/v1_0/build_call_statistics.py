@@ -0,0 +1,20 @@
+"""
+Patch: Build the Call Statistics rollup from the existing call history.
+
+From now on log_call keeps it up to date incrementally and a daily job
+reconciles the last days; this fills in everything logged before.
+"""
+
+import frappe
+from frappe.modules.utils import sync_customizations
+
+from az_it.az_it.doctype.call_statistics.call_statistics import rebuild_call_statistics
+
+
+def execute():
+    # custom_call_type comes from az_it/custom, which is synced after post_model_sync patches
+    if not frappe.db.has_column("Communication", "custom_call_type"):
+        sync_customizations("az_it")
+
+    rebuild_call_statistics()
+    frappe.db.commit()